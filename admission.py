@@ -0,0 +1,109 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+class AdmissionController:
+    """Bounded in-flight limit with a short wait queue; requests beyond both are shed.
+
+    Used to protect the expensive paths (uncached retrieval, ingestion) so that a
+    burst of slow requests cannot delay the ones that are cheap to answer.
+    """
+
+    def __init__(self, name: str, max_in_flight: int = 4, max_queue: int = 8, queue_timeout: float = 2.0):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self._condition = threading.Condition()
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.shed = 0
+        self.peak_queued = 0
+
+        # Exponentially weighted service time, used to suggest a Retry-After delay
+        self._avg_service_time = 0.0
+
+    def try_acquire(self, timeout: Optional[float] = None, background: bool = False) -> bool:
+        """Take a slot, waiting up to timeout in the queue; return False if the request is shed.
+
+        Background callers (e.g. cache warm-up) only take a free slot, never queue, and are left
+        out of the admitted/shed counters so those keep describing user requests.
+        """
+        timeout = self.queue_timeout if timeout is None else timeout
+        with self._condition:
+            if self.in_flight < self.max_in_flight:
+                self.in_flight += 1
+                if not background:
+                    self.admitted += 1
+                return True
+
+            if background:
+                return False
+
+            if self.queued >= self.max_queue or timeout <= 0:
+                self.shed += 1
+                return False
+
+            self.queued += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+            deadline = time.monotonic() + timeout
+            try:
+                while self.in_flight >= self.max_in_flight:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.shed += 1
+                        return False
+                    self._condition.wait(remaining)
+            finally:
+                self.queued -= 1
+
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+
+    def release(self, service_time: Optional[float] = None):
+        """Give a slot back, optionally recording how long the request held it"""
+        with self._condition:
+            self.in_flight -= 1
+            if service_time is not None:
+                if self._avg_service_time == 0.0:
+                    self._avg_service_time = service_time
+                else:
+                    self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * service_time
+            self._condition.notify()
+
+    @contextmanager
+    def slot(self, timeout: Optional[float] = None, background: bool = False):
+        """Context manager yielding whether the request was admitted"""
+        admitted = self.try_acquire(timeout, background)
+        start = time.monotonic()
+        try:
+            yield admitted
+        finally:
+            if admitted:
+                self.release(time.monotonic() - start)
+
+    def retry_after(self) -> int:
+        """Seconds a shed client should wait: roughly the time to drain the current queue"""
+        with self._condition:
+            backlog = self.in_flight + self.queued
+            estimate = self._avg_service_time * backlog / max(self.max_in_flight, 1)
+        return max(1, math.ceil(estimate))
+
+    def get_stats(self) -> Dict:
+        """Current queue depth and lifetime admission counters"""
+        with self._condition:
+            return {
+                'in_flight': self.in_flight,
+                'queue_depth': self.queued,
+                'peak_queue_depth': self.peak_queued,
+                'max_in_flight': self.max_in_flight,
+                'max_queue': self.max_queue,
+                'admitted': self.admitted,
+                'shed': self.shed,
+                'avg_service_time': self._avg_service_time
+            }
@@ -1,10 +1,20 @@
 from flask import Flask, render_template, request, jsonify
 import os
+import hmac
+import math
+import threading
 import time
 from werkzeug.utils import secure_filename
-from main import load_and_process_document, ask_question, add_document_to_vectordb, create_new_vectordb
+from main import (load_and_process_document, ask_question, ask_questions, add_document_to_vectordb,
+                  create_new_vectordb, extract_sources, save_index, append_index, load_index, clear_index,
+                  close_vectordb, DEFAULT_COLLECTION, collection_documents, build_filter)
 from semantic_cache import SemanticCache
 from evaluation import RAGEvaluator
+from dedup import ChunkDeduplicator
+from admission import AdmissionController
+from snapshot import export_snapshot, import_snapshot, resolve_snapshot_path, is_snapshot
+from warmup import CacheWarmer, WARMUP_ON_START
+import re
 import uuid
 
 app = Flask(__name__)
@@ -23,7 +33,88 @@ vectordb = None  # Single vector database for all documents
 
 # Initialize semantic cache and evaluator
 semantic_cache = SemanticCache(cache_dir="./cache", similarity_threshold=0.85)
-evaluator = RAGEvaluator(metrics_file="./metrics/rag_metrics.json")
+# The cache already holds answer text, so metrics records keep only a digest and length
+evaluator = RAGEvaluator(metrics_file="./metrics/rag_metrics.json", store_responses=False)
+
+# Near-duplicate chunk detection shared by every upload
+deduplicator = ChunkDeduplicator(threshold=0.8)
+
+# Admission control: uncached questions and uploads get separate concurrency budgets,
+# so ingestion never starves queries and cache hits never wait behind retrieval
+query_admission = AdmissionController("ask", max_in_flight=4, max_queue=16, queue_timeout=2.0)
+upload_admission = AdmissionController("upload", max_in_flight=1, max_queue=2, queue_timeout=10.0)
+
+# Shared secret for /admin endpoints, sent as the X-Admin-Token header; they stay disabled while it is unset
+ADMIN_TOKEN = os.environ.get("RAG_ADMIN_TOKEN", "")
+
+# Seconds a replaced or cleared store stays open, so questions already using it can finish
+RETIRE_DELAY = float(os.environ.get("RAG_RETIRE_DELAY", 60))
+
+# Serve a prebuilt index (from `python main.py index`) instead of re-embedding on this node
+prebuilt_index = load_index()
+if prebuilt_index:
+    vectordb, documents, loaded_deduplicator = prebuilt_index
+    deduplicator = loaded_deduplicator or deduplicator
+
+COLLECTION_NAME = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+def cache_partition(collection, sources):
+    """Semantic cache partition for a query scope; unscoped questions keep the original partition"""
+    if collection is None and not sources:
+        return ""
+    return f"{collection or '*'}|{','.join(sorted(sources or []))}"
+
+def answer_warmup_batch(questions):
+    """Answer historical questions against whatever index is current when the batch runs"""
+    if not vectordb or len(documents) == 0:
+        raise RuntimeError('No documents loaded')
+    return ask_questions(questions, vectordb, documents, deduplicator)
+
+# Pre-warm the semantic cache from the query log; warm-up batches yield to user misses
+cache_warmer = CacheWarmer(semantic_cache, evaluator, answer_warmup_batch, admission=query_admission)
+if vectordb is not None and WARMUP_ON_START:
+    cache_warmer.start()
+
+def overloaded_response(controller, message):
+    """Fast 503 telling the client when to retry"""
+    retry_after = controller.retry_after()
+    response = jsonify({'error': message, 'retry_after': retry_after})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def retire_vectordb(previous):
+    """Close a store that is no longer served once in-flight questions are done with it"""
+    if previous is None:
+        return
+    retire = threading.Timer(RETIRE_DELAY, close_vectordb, args=(previous,))
+    retire.daemon = True
+    retire.start()
+
+def bad_request(message):
+    """400 response for an invalid request body"""
+    response = jsonify({'success': False, 'error': message})
+    response.status_code = 400
+    return response
+
+def admin_error():
+    """403 response unless the request carries the admin token, otherwise None"""
+    if not ADMIN_TOKEN:
+        message = 'Admin endpoints are disabled. Set RAG_ADMIN_TOKEN to enable them.'
+    elif not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN):
+        message = 'Invalid or missing admin token'
+    else:
+        return None
+    response = jsonify({'success': False, 'error': message})
+    response.status_code = 403
+    return response
+
+def snapshot_path(data):
+    """Resolve the request's snapshot name inside RAG_SNAPSHOT_DIR, as (path, error response)"""
+    try:
+        return resolve_snapshot_path(data.get('path', '')), None
+    except ValueError as e:
+        return None, bad_request(str(e))
 
 @app.route('/')
 def index():
@@ -46,52 +137,75 @@ def upload_file():
     if file_ext not in allowed_extensions:
         return jsonify({'success': False, 'error': f'Unsupported file type. Please upload: {", ".join(allowed_extensions)}'})
     
+    collection = (request.form.get('collection') or DEFAULT_COLLECTION).strip()
+    if not COLLECTION_NAME.match(collection):
+        return jsonify({'success': False, 'error': 'Collection names may only contain letters, digits, "_" and "-"'})
+    
     if file:
-        try:
-            # Save the file
-            filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
+        with upload_admission.slot() as admitted:
+            if not admitted:
+                return overloaded_response(upload_admission, 'Too many uploads in progress. Please retry shortly.')
+            try:
+                # Save the file
+                filename = secure_filename(file.filename)
+                # Each named collection gets its own folder so the same file name can exist in several
+                upload_dir = app.config['UPLOAD_FOLDER']
+                if collection != DEFAULT_COLLECTION:
+                    upload_dir = os.path.join(upload_dir, collection)
+                    os.makedirs(upload_dir, exist_ok=True)
+                filepath = os.path.join(upload_dir, filename)
+                file.save(filepath)
             
-            # Check if file is empty
-            if os.path.getsize(filepath) == 0:
-                os.remove(filepath)  # Clean up empty file
-                return jsonify({'success': False, 'error': 'The uploaded file is empty'})
+                # Check if file is empty
+                if os.path.getsize(filepath) == 0:
+                    os.remove(filepath)  # Clean up empty file
+                    return jsonify({'success': False, 'error': 'The uploaded file is empty'})
             
-            # Add document to the collection
-            if vectordb is None:
-                # First document - create new vector database
-                vectordb = create_new_vectordb(filepath, filename)
-                documents.append({
-                    'id': str(uuid.uuid4()),
-                    'name': filename,
-                    'path': filepath
-                })
-            else:
-                # Add to existing vector database
-                add_document_to_vectordb(vectordb, filepath, filename)
-                documents.append({
-                    'id': str(uuid.uuid4()),
-                    'name': filename,
-                    'path': filepath
-                })
+                # Add document to the collection
+                if vectordb is None:
+                    # First document - create new vector database
+                    vectordb = create_new_vectordb(filepath, filename, deduplicator, collection)
+                    documents.append({
+                        'id': str(uuid.uuid4()),
+                        'name': filename,
+                        'path': filepath,
+                        'collection': collection
+                    })
+                    save_index(vectordb, documents, deduplicator)
+                else:
+                    # Add to existing vector database
+                    texts, vectors = add_document_to_vectordb(vectordb, filepath, filename, deduplicator, collection)
+                    documents.append({
+                        'id': str(uuid.uuid4()),
+                        'name': filename,
+                        'path': filepath,
+                        'collection': collection
+                    })
+                    # Only this upload's chunks are written; the full index is re-saved when the log grows
+                    append_index(vectordb, documents, deduplicator, texts, vectors)
             
-            return jsonify({
-                'success': True, 
-                'message': f'Document "{filename}" uploaded and added to your document collection! You now have {len(documents)} document(s) loaded.',
-                'document_count': len(documents)
-            })
+                dedup_report = deduplicator.last_report
+                collection_count = len(collection_documents(documents, collection))
+                return jsonify({
+                    'success': True, 
+                    'message': f'Document "{filename}" uploaded and added to collection "{collection}"! It now has {collection_count} document(s) loaded. '
+                               f'{dedup_report["duplicate_chunks"]} of {dedup_report["chunks"]} chunks were near-duplicates of indexed text.',
+                    'document_count': len(documents),
+                    'collection': collection,
+                    'collection_document_count': collection_count,
+                    'dedup': dedup_report
+                })
             
-        except ValueError as e:
-            # Clean up the file if it was saved
-            if os.path.exists(filepath):
-                os.remove(filepath)
-            return jsonify({'success': False, 'error': str(e)})
-        except Exception as e:
-            # Clean up the file if it was saved
-            if 'filepath' in locals() and os.path.exists(filepath):
-                os.remove(filepath)
-            return jsonify({'success': False, 'error': f'Error processing document: {str(e)}'})
+            except ValueError as e:
+                # Clean up the file if it was saved
+                if os.path.exists(filepath):
+                    os.remove(filepath)
+                return jsonify({'success': False, 'error': str(e)})
+            except Exception as e:
+                # Clean up the file if it was saved
+                if 'filepath' in locals() and os.path.exists(filepath):
+                    os.remove(filepath)
+                return jsonify({'success': False, 'error': f'Error processing document: {str(e)}'})
     
     return jsonify({'success': False, 'error': 'Invalid file'})
 
@@ -102,18 +216,42 @@ def ask():
     if not vectordb or len(documents) == 0:
         return jsonify({'error': 'Please upload at least one document first'})
     
-    data = request.get_json()
-    question = data.get('question', '').strip()
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return bad_request('Please send a JSON object with a question')
+    question = data.get('question', '')
+    if not isinstance(question, str):
+        return bad_request('question must be a string')
+    question = question.strip()
     
     if not question:
         return jsonify({'error': 'Please provide a question'})
     
+    # Optional scope: one collection and/or specific documents, pushed down into the vector search
+    collection = data.get('collection')
+    if collection is not None and not (isinstance(collection, str) and COLLECTION_NAME.fullmatch(collection)):
+        return bad_request('collection must be a name of letters, digits, "_" and "-"')
+    sources = data.get('documents') or []
+    if isinstance(sources, str):
+        sources = [sources]
+    if not isinstance(sources, list) or not all(isinstance(source, str) for source in sources):
+        return bad_request('documents must be a document name or a list of document names')
+    scope = collection_documents(documents, collection)
+    if not scope:
+        return jsonify({'error': f'Collection "{collection}" has no documents'})
+    unknown = sorted(set(sources) - {doc['name'] for doc in scope})
+    if unknown:
+        return jsonify({'error': f'Unknown document(s): {", ".join(unknown)}'})
+    partition = cache_partition(collection, sources)
+    if sources:
+        scope = [doc for doc in scope if doc['name'] in sources]
+    
     start_time = time.time()
     cache_hit = False
     
     try:
         # Check semantic cache first
-        cached_result = semantic_cache.get(question)
+        cached_result = semantic_cache.get(question, partition)
         if cached_result:
             cache_hit = True
             response_time = time.time() - start_time
@@ -133,29 +271,29 @@ def ask():
                 'response_time': response_time
             })
         
-        # Get answer from RAG system
-        answer = ask_question(question, vectordb, documents)
+        # Get answer from RAG system; only this expensive miss path takes an admission slot
+        with query_admission.slot() as admitted:
+            if not admitted:
+                return overloaded_response(query_admission, 'The server is busy answering other questions. Please retry shortly.')
+            answer = ask_question(question, vectordb, scope, deduplicator,
+                                  build_filter(collection, sources, deduplicator))
         response_time = time.time() - start_time
         
         # Extract sources from answer
-        sources = []
-        if "📄 **From:" in answer:
-            import re
-            source_matches = re.findall(r"📄 \*\*From: ([^*]+)\*\*", answer)
-            sources = source_matches
+        answer_sources = extract_sources(answer)
         
         # Cache the result
         semantic_cache.set(question, {
             'response': answer,
-            'sources': sources,
+            'sources': answer_sources,
             'response_time': response_time
-        })
+        }, partition)
         
         # Evaluate the response
         evaluator.evaluate_response(
             query=question,
             response=answer,
-            sources=sources,
+            sources=answer_sources,
             response_time=response_time,
             cache_hit=False
         )
@@ -172,19 +310,41 @@ def ask():
 
 @app.route('/documents', methods=['GET'])
 def get_documents():
-    """Get list of uploaded documents"""
+    """Get list of uploaded documents, optionally for one collection"""
     global documents
+    selected = collection_documents(documents, request.args.get('collection'))
+    return jsonify({
+        'documents': selected,
+        'count': len(selected)
+    })
+
+@app.route('/collections', methods=['GET'])
+def get_collections():
+    """Collections with their document counts"""
+    counts = {}
+    for doc in documents:
+        name = doc.get('collection', DEFAULT_COLLECTION)
+        counts[name] = counts.get(name, 0) + 1
     return jsonify({
-        'documents': documents,
-        'count': len(documents)
+        'collections': [{'name': name, 'document_count': count} for name, count in sorted(counts.items())],
+        'count': len(counts)
     })
 
 @app.route('/clear-documents', methods=['POST'])
 def clear_documents():
     """Clear all uploaded documents"""
     global documents, vectordb
-    documents = []
-    vectordb = None
+    # Shares the upload budget so clearing never races an ingestion or a snapshot
+    with upload_admission.slot() as admitted:
+        if not admitted:
+            return overloaded_response(upload_admission, 'Index is busy. Please retry shortly.')
+        # /ask does not take the upload slot, so questions may still be using the old store
+        previous = vectordb
+        clear_index(None)
+        documents = []
+        vectordb = None
+        deduplicator.clear()
+        retire_vectordb(previous)
     return jsonify({
         'success': True,
         'message': 'All documents cleared successfully!'
@@ -208,9 +368,71 @@ def get_metrics():
     return jsonify({
         'summary': summary,
         'recent': recent,
-        'cache_stats': semantic_cache.get_stats()
+        'cache_stats': semantic_cache.get_stats(),
+        'dedup_stats': deduplicator.get_stats(),
+        'admission': {
+            'ask': query_admission.get_stats(),
+            'upload': upload_admission.get_stats()
+        },
+        'warmup': cache_warmer.get_status()
     })
 
+@app.route('/admin/snapshot/export', methods=['POST'])
+def snapshot_export():
+    """Write the index (and optionally the semantic cache) to a snapshot bundle in the snapshot directory"""
+    denied = admin_error()
+    if denied:
+        return denied
+    data = request.get_json(silent=True) or {}
+    path, error = snapshot_path(data)
+    if error:
+        return error
+    
+    # Shares the upload budget so a snapshot never races an ingestion
+    with upload_admission.slot() as admitted:
+        if not admitted:
+            return overloaded_response(upload_admission, 'Index is busy. Please retry shortly.')
+        try:
+            stats = export_snapshot(path, vectordb, documents, deduplicator,
+                                    semantic_cache if data.get('include_cache') else None)
+        except Exception as e:
+            return jsonify({'success': False, 'error': f'Error exporting snapshot: {str(e)}'})
+    
+    return jsonify({'success': True, 'snapshot': stats})
+
+@app.route('/admin/snapshot/import', methods=['POST'])
+def snapshot_import():
+    """Replace the index with a snapshot bundle, without re-embedding any chunk"""
+    global documents, vectordb, deduplicator
+    denied = admin_error()
+    if denied:
+        return denied
+    data = request.get_json(silent=True) or {}
+    path, error = snapshot_path(data)
+    if error:
+        return error
+    if not is_snapshot(path):
+        return jsonify({'success': False, 'error': f"No snapshot named '{data['path']}'"})
+    
+    with upload_admission.slot() as admitted:
+        if not admitted:
+            return overloaded_response(upload_admission, 'Index is busy. Please retry shortly.')
+        try:
+            new_vectordb, new_documents, loaded_deduplicator, stats = import_snapshot(
+                path, semantic_cache if data.get('include_cache') else None
+            )
+        except Exception as e:
+            return jsonify({'success': False, 'error': f'Error importing snapshot: {str(e)}'})
+        
+        # Swap in the complete new index, then close the old one once in-flight questions are done with it
+        previous = vectordb
+        vectordb, documents = new_vectordb, new_documents
+        deduplicator = loaded_deduplicator or ChunkDeduplicator(threshold=0.8)
+        save_index(vectordb, documents, deduplicator, snapshot=stats)
+        retire_vectordb(previous)
+    
+    return jsonify({'success': True, 'snapshot': stats, 'document_count': len(documents)})
+
 @app.route('/report', methods=['GET'])
 def get_report():
     """Get performance report"""
@@ -221,11 +443,37 @@ def get_report():
 def clear_cache():
     """Clear semantic cache"""
     semantic_cache.clear()
+    warming = vectordb is not None and WARMUP_ON_START and cache_warmer.start()
     return jsonify({
         'success': True,
-        'message': 'Semantic cache cleared successfully!'
+        'message': 'Semantic cache cleared successfully!' + (' Re-warming from query history.' if warming else ''),
+        'warmup_started': bool(warming)
     })
 
+@app.route('/cache/warmup', methods=['GET', 'POST'])
+def cache_warmup():
+    """Start a cache warm-up run (POST) or report its progress (GET)"""
+    if request.method == 'GET':
+        return jsonify({'warmup': cache_warmer.get_status()})
+    
+    if not vectordb or len(documents) == 0:
+        return jsonify({'success': False, 'error': 'Please upload at least one document first'})
+    
+    data = request.get_json(silent=True) or {}
+    max_queries, time_budget = data.get('max_queries'), data.get('time_budget')
+    # JSON booleans are ints in Python, so they are rejected explicitly
+    if max_queries is not None and (isinstance(max_queries, bool) or not isinstance(max_queries, int)
+                                    or max_queries <= 0):
+        return bad_request('max_queries must be a positive integer')
+    if time_budget is not None and (isinstance(time_budget, bool) or not isinstance(time_budget, (int, float))
+                                    or not math.isfinite(time_budget) or time_budget <= 0):
+        return bad_request('time_budget must be a positive number of seconds')
+    
+    started = cache_warmer.start(max_queries=max_queries, time_budget=time_budget)
+    if not started:
+        return jsonify({'success': False, 'error': 'A warm-up is already running', 'warmup': cache_warmer.get_status()})
+    return jsonify({'success': True, 'warmup': cache_warmer.get_status()})
+
 @app.route('/clear-metrics', methods=['POST'])
 def clear_metrics():
     """Clear performance metrics"""
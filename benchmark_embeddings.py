@@ -0,0 +1,120 @@
+"""Benchmark embedding backends: throughput and retrieval quality on the sample corpus.
+
+Usage:
+    python benchmark_embeddings.py [--backends minilm minilm-int8 hashing] [--docs document] [--k 5]
+
+Quality is reported two ways for every backend:
+  * self-retrieval hit@k: the first sentence of each chunk is used as a query and
+    must retrieve its own chunk in the top k
+  * recall@k against the reference backend (the first one listed): overlap of the
+    top-k chunk sets for the same queries
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import time
+from typing import Dict, List
+import numpy as np
+from langchain_community.document_loaders import TextLoader
+from embeddings import BACKENDS, get_embedding_backend
+from main import preprocess_text, split_documents
+
+def load_corpus_chunks(docs_dir: str) -> List[str]:
+    """Load and chunk every .txt file in docs_dir with the production splitter"""
+    chunks = []
+    for path in sorted(glob.glob(os.path.join(docs_dir, "*.txt"))):
+        documents = TextLoader(path).load()
+        for doc in documents:
+            doc.page_content = preprocess_text(doc.page_content)
+        chunks.extend(chunk.page_content for chunk in split_documents(documents))
+    return chunks
+
+def make_queries(chunks: List[str]) -> List[str]:
+    """Use the first sentence of each chunk as a query for that chunk"""
+    queries = []
+    for chunk in chunks:
+        sentence = re.split(r"(?<=[\.\!\?])\s", chunk, maxsplit=1)[0]
+        queries.append(sentence[:200])
+    return queries
+
+def top_k(query_matrix: np.ndarray, chunk_matrix: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k most cosine-similar chunks for every query"""
+    def normalize(matrix):
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    scores = normalize(query_matrix) @ normalize(chunk_matrix).T
+    k = min(k, chunk_matrix.shape[0])
+    return np.argsort(-scores, axis=1)[:, :k]
+
+def benchmark_backend(name: str, chunks: List[str], queries: List[str], k: int, repeats: int) -> Dict:
+    """Measure load time, embed throughput and self-retrieval quality for one backend"""
+    start = time.perf_counter()
+    backend = get_embedding_backend(name)
+    load_time = time.perf_counter() - start
+
+    # Warm up once so lazy initialisation is not counted as throughput
+    backend.encode(chunks[:1])
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        chunk_matrix = backend.encode(chunks)
+    embed_time = (time.perf_counter() - start) / repeats
+
+    query_matrix = backend.encode(queries)
+    neighbours = top_k(query_matrix, chunk_matrix, k)
+    hits = [i in neighbours[i] for i in range(len(queries))]
+
+    return {
+        'backend': name,
+        'dimension': int(chunk_matrix.shape[1]),
+        'load_time_s': load_time,
+        'chunks_per_sec': len(chunks) / embed_time if embed_time > 0 else float('inf'),
+        'self_hit_at_k': float(np.mean(hits)),
+        'neighbours': neighbours
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark embedding backends")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument("--docs", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "document"))
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", help="Optional path for JSON results")
+    args = parser.parse_args()
+
+    chunks = load_corpus_chunks(args.docs)
+    if not chunks:
+        raise SystemExit(f"No .txt chunks found in {args.docs}")
+    queries = make_queries(chunks)
+    print(f"Benchmarking {len(args.backends)} backend(s) on {len(chunks)} chunks, k={args.k}\n")
+
+    results = [benchmark_backend(name, chunks, queries, args.k, args.repeats) for name in args.backends]
+
+    # Retrieval-quality delta against the reference (first) backend
+    reference = results[0]
+    for result in results:
+        overlaps = [
+            len(set(result['neighbours'][i]) & set(reference['neighbours'][i])) / len(reference['neighbours'][i])
+            for i in range(len(queries))
+        ]
+        result['recall_vs_reference'] = float(np.mean(overlaps))
+        result['hit_delta_vs_reference'] = result['self_hit_at_k'] - reference['self_hit_at_k']
+        del result['neighbours']
+
+    print(f"{'backend':<14}{'dim':>6}{'load s':>9}{'chunks/s':>11}{'hit@k':>8}{'Δhit':>8}{'recall@k vs ref':>17}")
+    for r in results:
+        print(f"{r['backend']:<14}{r['dimension']:>6}{r['load_time_s']:>9.2f}{r['chunks_per_sec']:>11.1f}"
+              f"{r['self_hit_at_k']:>8.3f}{r['hit_delta_vs_reference']:>+8.3f}{r['recall_vs_reference']:>17.3f}")
+    print(f"\nReference backend: {reference['backend']}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'k': args.k, 'chunks': len(chunks), 'results': results}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
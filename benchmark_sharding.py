@@ -0,0 +1,61 @@
+"""Benchmark scatter-gather search latency of the sharded vector store against shard count.
+
+Usage:
+    python benchmark_sharding.py [--vectors 300000] [--shards 1 2 4 8] [--dtype int8]
+
+Random unit vectors stand in for chunk embeddings; results are checked against a
+single-shard search so the merged top-k is known to be exact.
+"""
+import argparse
+import time
+import numpy as np
+from embeddings import HashingBackend
+from sharding import ShardedVectorStore
+from vector_store import SUPPORTED_DTYPES
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sharded vector search")
+    parser.add_argument("--vectors", type=int, default=300000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--dtype", default="float32", choices=SUPPORTED_DTYPES)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=6)
+    parser.add_argument("--fetch-k", type=int, default=15)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(args.vectors, args.dimension)).astype(np.float32)
+    queries = rng.normal(size=(args.queries, args.dimension)).astype(np.float32)
+    texts = [f"chunk {i}" for i in range(args.vectors)]
+    ids = [str(i) for i in range(args.vectors)]
+    embedding = HashingBackend(dimension=args.dimension)
+
+    reference = None
+    print(f"{args.vectors} vectors (dim {args.dimension}, {args.dtype}), {args.queries} queries, "
+          f"k={args.k}, fetch_k={args.fetch_k}\n")
+    print(f"{'shards':>7}{'load s':>9}{'top-k p50 ms':>14}{'mmr p50 ms':>12}{'mmr p95 ms':>12}{'exact':>8}")
+    for num_shards in args.shards:
+        store = ShardedVectorStore(embedding, num_shards=num_shards, dtype=args.dtype, shard_by="hash")
+        start = time.perf_counter()
+        store.add_embeddings(texts, vectors, ids=ids)
+        load_time = time.perf_counter() - start
+
+        topk_times, mmr_times, results = [], [], []
+        for query in queries:
+            start = time.perf_counter()
+            results.append([doc.page_content for doc in store.similarity_search_by_vector(query, args.k)])
+            topk_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            store.max_marginal_relevance_search_by_vector(query, args.k, args.fetch_k)
+            mmr_times.append(time.perf_counter() - start)
+        store.close()
+
+        reference = reference or results
+        exact = np.mean([set(a) == set(b) for a, b in zip(results, reference)])
+        print(f"{num_shards:>7}{load_time:>9.2f}{np.percentile(topk_times, 50) * 1000:>14.2f}"
+              f"{np.percentile(mmr_times, 50) * 1000:>12.2f}{np.percentile(mmr_times, 95) * 1000:>12.2f}{exact:>8.2f}")
+
+if __name__ == "__main__":
+    main()
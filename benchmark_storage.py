@@ -0,0 +1,101 @@
+"""Benchmark compact embedding storage: memory saved and recall cost of float16/int8.
+
+Usage:
+    python benchmark_storage.py [--backend hashing] [--synthetic 100000] [--k 5]
+
+The corpus chunks under document/ are embedded with the chosen backend; optional
+synthetic vectors (random perturbations of the real ones) pad the index out to a
+realistic size. Every dtype is compared against exact float32 search:
+  * index: recall@k of the top-k chunk ids and query latency
+  * cache: agreement of the top-1 cached query and of the hit/miss decision at the
+    semantic cache threshold
+"""
+import argparse
+import json
+import os
+import time
+from typing import Dict
+import numpy as np
+from benchmark_embeddings import load_corpus_chunks, make_queries
+from embeddings import BACKENDS, DEFAULT_BACKEND, get_embedding_backend
+from vector_store import EmbeddingMatrix, SUPPORTED_DTYPES
+
+def build_vectors(chunk_vectors: np.ndarray, synthetic: int, seed: int = 0) -> np.ndarray:
+    """Pad the real chunk vectors with noisy copies to simulate a larger index"""
+    if synthetic <= 0:
+        return chunk_vectors
+    rng = np.random.default_rng(seed)
+    base = chunk_vectors[rng.integers(0, len(chunk_vectors), synthetic)]
+    scale = np.linalg.norm(chunk_vectors, axis=1).mean() / np.sqrt(chunk_vectors.shape[1])
+    noise = rng.normal(0, scale, base.shape).astype(np.float32)
+    return np.vstack([chunk_vectors, base + noise])
+
+def evaluate_dtype(dtype: str, vectors: np.ndarray, queries: np.ndarray, exact: Dict, k: int,
+                   threshold: float) -> Dict:
+    """Search with one storage dtype and compare to the float32 reference"""
+    matrix = EmbeddingMatrix(dtype=dtype)
+    matrix.add(vectors)
+
+    recalls, top1_agree, decision_agree, latencies = [], [], [], []
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        rows, scores = matrix.search(query, k)
+        latencies.append(time.perf_counter() - start)
+
+        recalls.append(len(set(rows) & exact['rows'][i]) / len(exact['rows'][i]))
+        top1_agree.append(rows[0] == exact['top1'][i])
+        decision_agree.append((scores[0] >= threshold) == exact['hit'][i])
+
+    return {
+        'dtype': dtype,
+        'bytes': matrix.nbytes,
+        'bytes_per_vector': matrix.nbytes / len(vectors),
+        'index_recall_at_k': float(np.mean(recalls)),
+        'cache_top1_agreement': float(np.mean(top1_agree)),
+        'cache_decision_agreement': float(np.mean(decision_agree)),
+        'query_ms_p50': float(np.percentile(latencies, 50) * 1000)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark float16/int8 embedding storage")
+    parser.add_argument("--backend", default=DEFAULT_BACKEND, choices=list(BACKENDS))
+    parser.add_argument("--docs", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "document"))
+    parser.add_argument("--synthetic", type=int, default=20000, help="Extra synthetic vectors to add")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=0.85, help="Semantic cache similarity threshold")
+    parser.add_argument("--output", help="Optional path for JSON results")
+    args = parser.parse_args()
+
+    backend = get_embedding_backend(args.backend)
+    chunks = load_corpus_chunks(args.docs)
+    if not chunks:
+        raise SystemExit(f"No .txt chunks found in {args.docs}")
+    vectors = build_vectors(backend.encode(chunks), args.synthetic)
+    queries = backend.encode(make_queries(chunks))
+    print(f"Index of {len(vectors)} vectors (dim {vectors.shape[1]}), {len(queries)} queries, k={args.k}\n")
+
+    reference = EmbeddingMatrix(dtype="float32")
+    reference.add(vectors)
+    exact = {'rows': [], 'top1': [], 'hit': []}
+    for query in queries:
+        rows, scores = reference.search(query, args.k)
+        exact['rows'].append(set(rows))
+        exact['top1'].append(rows[0])
+        exact['hit'].append(scores[0] >= args.threshold)
+
+    results = [evaluate_dtype(dtype, vectors, queries, exact, args.k, args.threshold) for dtype in SUPPORTED_DTYPES]
+    baseline_bytes = results[0]['bytes']
+
+    print(f"{'dtype':<9}{'MB':>9}{'saved':>8}{'recall@k':>10}{'top1':>8}{'hit/miss':>10}{'p50 ms':>9}")
+    for r in results:
+        r['memory_saved'] = 1 - r['bytes'] / baseline_bytes
+        print(f"{r['dtype']:<9}{r['bytes'] / 1e6:>9.2f}{r['memory_saved']:>8.1%}{r['index_recall_at_k']:>10.3f}"
+              f"{r['cache_top1_agreement']:>8.3f}{r['cache_decision_agreement']:>10.3f}{r['query_ms_p50']:>9.2f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'backend': args.backend, 'vectors': len(vectors), 'k': args.k, 'results': results}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+if __name__ == "__main__":
+    main()
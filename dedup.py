@@ -0,0 +1,205 @@
+import hashlib
+import re
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+# Chunks are only compared within a namespace (one per collection); the default
+# namespace keeps the original bucket keys so deduplicators saved earlier still match
+DEFAULT_NAMESPACE = "default"
+
+class ChunkDeduplicator:
+    """MinHash/LSH near-duplicate detection for chunks at ingest time.
+
+    Each chunk is reduced to a MinHash signature over word shingles. Signatures are
+    split into bands and bucketed, so only chunks sharing a band are compared. A
+    chunk whose estimated Jaccard similarity with an indexed chunk reaches the
+    threshold is not indexed again; its source is recorded on the canonical chunk's
+    group instead.
+
+    Namespaces keep collections apart: a chunk is only matched against chunks
+    indexed in the same namespace.
+    """
+
+    def __init__(self, threshold=0.8, num_perm=128, bands=16, shingle_size=5, seed=1):
+        if num_perm % bands != 0:
+            raise ValueError("num_perm must be divisible by bands")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+
+        # Random xor-multiply hash family, one (mask, odd multiplier) pair per permutation
+        rng = np.random.default_rng(seed)
+        self._masks = rng.integers(0, 2**63, num_perm, dtype=np.uint64)
+        self._multipliers = rng.integers(0, 2**63, num_perm, dtype=np.uint64) | np.uint64(1)
+
+        self.signatures: Dict[str, np.ndarray] = {}
+        self.buckets: Dict[Tuple[int, bytes], List[str]] = defaultdict(list)
+        self.groups: Dict[str, List[str]] = {}
+        # Source -> canonical chunks it matched, so a document filter can include text dropped from it
+        self.shared: Dict[str, List[str]] = defaultdict(list)
+        self.last_report: Optional[Dict] = None
+        # What the last deduplicate() call registered, so rollback() can undo it
+        self._changes: List[Tuple[str, str, str]] = []
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_changes'] = []
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__.setdefault('_changes', [])
+        if 'shared' not in state:
+            # Deduplicators pickled before the shared index existed rebuild it from their groups
+            self.shared = defaultdict(list)
+            for chunk_id, sources in self.groups.items():
+                for source in sources[1:]:
+                    self.shared[source].append(chunk_id)
+
+    def _shingles(self, text: str) -> np.ndarray:
+        """64-bit hashes of the word shingles in a chunk"""
+        words = re.findall(r"\w+", text.lower())
+        size = min(self.shingle_size, len(words)) or 1
+        shingles = {" ".join(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))}
+        return np.array(
+            [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "little") for s in shingles],
+            dtype=np.uint64
+        )
+
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash signature of a chunk"""
+        hashes = self._shingles(text)
+        # uint64 multiplication wraps modulo 2**64, which is what the hash family needs
+        with np.errstate(over='ignore'):
+            permuted = (hashes[:, None] ^ self._masks[None, :]) * self._multipliers[None, :]
+        return permuted.min(axis=0)
+
+    def _band_keys(self, signature: np.ndarray, namespace: str = DEFAULT_NAMESPACE):
+        for band in range(self.bands):
+            key = signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            yield (band, key) if namespace == DEFAULT_NAMESPACE else (namespace, band, key)
+
+    def find_duplicate(self, signature: np.ndarray, namespace: str = DEFAULT_NAMESPACE) -> Optional[str]:
+        """Return the id of an indexed chunk in the namespace similar enough to the signature, if any"""
+        candidates = set()
+        for key in self._band_keys(signature, namespace):
+            candidates.update(self.buckets.get(key, ()))
+
+        best_id, best_similarity = None, self.threshold
+        for chunk_id in candidates:
+            similarity = float(np.mean(self.signatures[chunk_id] == signature))
+            if similarity >= best_similarity:
+                best_id, best_similarity = chunk_id, similarity
+        return best_id
+
+    def add(self, chunk_id: str, signature: np.ndarray, source: str, namespace: str = DEFAULT_NAMESPACE):
+        """Register a chunk as the canonical member of a new group"""
+        self.signatures[chunk_id] = signature
+        for key in self._band_keys(signature, namespace):
+            self.buckets[key].append(chunk_id)
+        self.groups[chunk_id] = [source]
+
+    def deduplicate(self, chunks, source: str, namespace: str = DEFAULT_NAMESPACE):
+        """Assign chunk ids and drop near-duplicates, returning (unique chunks, report).
+
+        Call rollback() if the unique chunks then fail to reach the vector store.
+        """
+        unique = []
+        self._changes = []
+        for chunk in chunks:
+            signature = self.signature(chunk.page_content)
+            duplicate_of = self.find_duplicate(signature, namespace)
+            if duplicate_of is not None:
+                if source not in self.groups[duplicate_of]:
+                    self.groups[duplicate_of].append(source)
+                    self.shared[source].append(duplicate_of)
+                    self._changes.append(('share', duplicate_of, source))
+                continue
+
+            chunk_id = uuid.uuid4().hex
+            chunk.metadata['chunk_id'] = chunk_id
+            self.add(chunk_id, signature, source, namespace)
+            self._changes.append(('add', chunk_id, namespace))
+            unique.append(chunk)
+
+        total = len(chunks)
+        self.last_report = {
+            'source': source,
+            'chunks': total,
+            'unique_chunks': len(unique),
+            'duplicate_chunks': total - len(unique),
+            'dedup_ratio': (total - len(unique)) / total if total else 0.0
+        }
+        print(f"Dedup: {self.last_report['duplicate_chunks']}/{total} chunks were near-duplicates "
+              f"({self.last_report['dedup_ratio']:.1%})")
+        return unique, self.last_report
+
+    def rollback(self):
+        """Undo the last deduplicate() call, so a failed ingest does not make a retry look like a duplicate"""
+        for action, chunk_id, detail in reversed(self._changes):
+            if action == 'add':
+                for key in self._band_keys(self.signatures[chunk_id], detail):
+                    self.buckets[key].remove(chunk_id)
+                    if not self.buckets[key]:
+                        del self.buckets[key]
+                del self.signatures[chunk_id], self.groups[chunk_id]
+            else:
+                self.groups[chunk_id].remove(detail)
+                self.shared[detail].remove(chunk_id)
+                if not self.shared[detail]:
+                    del self.shared[detail]
+        if self._changes:
+            print(f"↩️ Dedup: rolled back {len(self._changes)} registration(s)")
+        self._changes = []
+        self.last_report = None
+
+    def export_changes(self) -> List[Tuple]:
+        """What the last deduplicate() call registered, in a form apply_changes() can replay elsewhere"""
+        changes = []
+        for action, chunk_id, detail in self._changes:
+            if action == 'add':
+                changes.append(('add', chunk_id, detail, self.signatures[chunk_id], self.groups[chunk_id][0]))
+            else:
+                changes.append(('share', chunk_id, detail))
+        return changes
+
+    def apply_changes(self, changes: List[Tuple]):
+        """Replay registrations exported by export_changes(), e.g. from an append-only index log"""
+        for change in changes:
+            if change[0] == 'add':
+                _, chunk_id, namespace, signature, source = change
+                self.add(chunk_id, signature, source, namespace)
+            else:
+                _, chunk_id, source = change
+                self.groups[chunk_id].append(source)
+                self.shared[source].append(chunk_id)
+
+    def sources_for(self, chunk_id: str) -> List[str]:
+        """Every source document that contained the chunk or a near-duplicate of it"""
+        return list(self.groups.get(chunk_id, []))
+
+    def shared_chunk_ids(self, sources: List[str]) -> List[str]:
+        """Canonical chunks stored under another document that the given sources also contained"""
+        return [chunk_id for source in sources for chunk_id in self.shared.get(source, [])]
+
+    def clear(self):
+        """Forget every indexed chunk"""
+        self.signatures = {}
+        self.buckets = defaultdict(list)
+        self.groups = {}
+        self.shared = defaultdict(list)
+        self.last_report = None
+        self._changes = []
+
+    def get_stats(self) -> Dict:
+        """Group statistics across all uploads"""
+        references = sum(len(sources) for sources in self.groups.values())
+        return {
+            'unique_chunks': len(self.groups),
+            'duplicate_groups': sum(1 for sources in self.groups.values() if len(sources) > 1),
+            'source_references': references
+        }
@@ -0,0 +1,118 @@
+import hashlib
+import os
+import re
+import threading
+from typing import Dict, List, Optional
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Backend used when none is requested explicitly ("minilm", "minilm-int8" or "hashing")
+DEFAULT_BACKEND = os.environ.get("RAG_EMBEDDING_BACKEND", "minilm")
+
+class EmbeddingBackend(Embeddings):
+    """Base class for embedding backends shared by the vector store and the semantic cache"""
+    name = "base"
+    dimension = 0
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Embed a batch of texts into a float32 matrix of shape (len(texts), dimension)"""
+        raise NotImplementedError
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """LangChain interface: embed a list of chunks"""
+        if not texts:
+            return []
+        return self.encode(list(texts)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        """LangChain interface: embed a single query"""
+        return self.encode([text])[0].tolist()
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """The original fp32 sentence-transformers model on CPU"""
+    name = "minilm"
+
+    def __init__(self, model_name=DEFAULT_MODEL_NAME, device="cpu", batch_size=32):
+        from sentence_transformers import SentenceTransformer
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.model = SentenceTransformer(model_name, device=device)
+        self.dimension = self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        embeddings = self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+        return np.asarray(embeddings, dtype=np.float32)
+
+class QuantizedSentenceTransformerBackend(SentenceTransformerBackend):
+    """Same model with its Linear layers dynamically quantized to int8 for faster CPU inference"""
+    name = "minilm-int8"
+
+    def __init__(self, model_name=DEFAULT_MODEL_NAME, batch_size=32):
+        import torch
+
+        super().__init__(model_name=model_name, device="cpu", batch_size=batch_size)
+        self.model = torch.quantization.quantize_dynamic(
+            self.model, {torch.nn.Linear}, dtype=torch.qint8
+        )
+
+class HashingBackend(EmbeddingBackend):
+    """Dependency-free signed feature-hashing embedder for tests and air-gapped builds"""
+    name = "hashing"
+
+    def __init__(self, dimension=384, ngram_range=(1, 2)):
+        self.dimension = dimension
+        self.ngram_range = ngram_range
+
+    def _features(self, text: str) -> List[str]:
+        """Word n-grams of the lowercased text"""
+        words = re.findall(r"\w+", text.lower())
+        features = []
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            for i in range(len(words) - n + 1):
+                features.append(" ".join(words[i:i + n]))
+        return features
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                index = value % self.dimension
+                sign = 1.0 if (value >> 63) & 1 else -1.0
+                matrix[row, index] += sign
+
+        # L2-normalize so dot products are cosine similarities
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+BACKENDS = {
+    SentenceTransformerBackend.name: SentenceTransformerBackend,
+    QuantizedSentenceTransformerBackend.name: QuantizedSentenceTransformerBackend,
+    HashingBackend.name: HashingBackend,
+}
+
+_backend_instances: Dict[str, EmbeddingBackend] = {}
+_backend_lock = threading.Lock()
+
+def get_embedding_backend(name: Optional[str] = None) -> EmbeddingBackend:
+    """Return a shared embedding backend instance, loading the model only once per process"""
+    name = name or DEFAULT_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{name}'. Choose one of: {', '.join(BACKENDS)}")
+
+    with _backend_lock:
+        if name not in _backend_instances:
+            print(f"Loading embedding backend: {name}")
+            _backend_instances[name] = BACKENDS[name]()
+        return _backend_instances[name]
@@ -1,7 +1,10 @@
 import time
+import hashlib
 import json
 import os
-from typing import List, Dict, Tuple
+import re
+import threading
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime
 import numpy as np
 from dataclasses import dataclass
@@ -20,11 +23,19 @@ class EvaluationMetrics:
     timestamp: str = ""
 
 class RAGEvaluator:
-    def __init__(self, metrics_file="./metrics/rag_metrics.json"):
+    def __init__(self, metrics_file="./metrics/rag_metrics.json", store_responses=True):
         self.metrics_file = metrics_file
         self.metrics_dir = os.path.dirname(metrics_file)
+        # Without full responses each record keeps a digest and length, so metrics stay small
+        self.store_responses = store_responses
         os.makedirs(self.metrics_dir, exist_ok=True)
         
+        # Serializes appends and saves from concurrent requests
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._version = 0
+        self._saved_version = 0
+        
         # Load existing metrics
         self.metrics = self._load_metrics()
         
@@ -44,9 +55,19 @@ class RAGEvaluator:
         return []
     
     def _save_metrics(self):
-        """Save metrics to file"""
-        with open(self.metrics_file, 'w') as f:
-            json.dump(self.metrics, f, indent=2)
+        """Save metrics to file from a snapshot, so readers are not blocked while writing"""
+        with self._lock:
+            self._version += 1
+            version = self._version
+            metrics = list(self.metrics)
+        
+        with self._save_lock:
+            # A concurrent save may already have written a newer snapshot
+            if version < self._saved_version:
+                return
+            with open(self.metrics_file, 'w') as f:
+                json.dump(metrics, f, indent=2)
+            self._saved_version = version
     
     def evaluate_response(self, query: str, response: str, sources: List[str], 
                         response_time: float, cache_hit: bool = False) -> EvaluationMetrics:
@@ -68,24 +89,33 @@ class RAGEvaluator:
         # Calculate completeness
         metrics.completeness = self._calculate_completeness(response)
         
-        # Store metrics
-        self.metrics.append({
-            'query': metrics.query,
-            'response': metrics.response,
-            'sources': metrics.sources,
-            'response_time': metrics.response_time,
-            'relevance_score': metrics.relevance_score,
-            'factual_consistency': metrics.factual_consistency,
-            'completeness': metrics.completeness,
-            'cache_hit': cache_hit,
-            'timestamp': metrics.timestamp
-        })
-        
-        # Update performance tracking
-        self.query_times.append(response_time)
-        self.total_queries += 1
-        if cache_hit:
-            self.cache_hits += 1
+        if self.store_responses:
+            response_fields = {'response': metrics.response}
+        else:
+            response_fields = {
+                'response_sha1': hashlib.sha1(metrics.response.encode()).hexdigest(),
+                'response_length': len(metrics.response)
+            }
+        
+        with self._lock:
+            # Store metrics
+            self.metrics.append({
+                'query': metrics.query,
+                **response_fields,
+                'sources': metrics.sources,
+                'response_time': metrics.response_time,
+                'relevance_score': metrics.relevance_score,
+                'factual_consistency': metrics.factual_consistency,
+                'completeness': metrics.completeness,
+                'cache_hit': cache_hit,
+                'timestamp': metrics.timestamp
+            })
+        
+            # Update performance tracking
+            self.query_times.append(response_time)
+            self.total_queries += 1
+            if cache_hit:
+                self.cache_hits += 1
         
         # Save metrics
         self._save_metrics()
@@ -149,9 +179,54 @@ class RAGEvaluator:
         
         return (length_score + structure_score) / 2
     
+    def _ngrams(self, text: str, n: int = 3) -> set:
+        words = re.findall(r"\w+", text.lower())
+        n = min(n, len(words)) or 1
+        return {tuple(words[i:i + n]) for i in range(max(len(words) - n + 1, 1))}
+    
+    def evaluate_retrieval(self, retrieved: List[str], passages: List[str], k: Optional[int] = None,
+                           min_coverage: float = 0.5) -> Dict:
+        """Score a ranked retrieval against golden passages.
+        
+        A passage counts as retrieved once the chunks ranked so far contain at least
+        min_coverage of its word trigrams, so passages split across chunks still count.
+        Returns recall@k (share of passages retrieved) and the reciprocal rank at which
+        the first passage was retrieved.
+        """
+        retrieved = retrieved[:k] if k else retrieved
+        targets = [self._ngrams(passage) for passage in passages]
+        found = [False] * len(targets)
+        first_rank = None
+        seen = set()
+        for rank, text in enumerate(retrieved, 1):
+            seen |= self._ngrams(text)
+            for i, target in enumerate(targets):
+                if not found[i] and len(target & seen) >= min_coverage * len(target):
+                    found[i] = True
+                    first_rank = first_rank or rank
+        
+        return {
+            'recall': sum(found) / len(targets) if targets else 0.0,
+            'reciprocal_rank': 1.0 / first_rank if first_rank else 0.0,
+            'retrieved': len(retrieved)
+        }
+    
+    def summarize_retrieval(self, results: List[Dict]) -> Dict:
+        """Mean recall@k and MRR over a golden set"""
+        if not results:
+            return {'questions': 0, 'recall_at_k': 0.0, 'mrr': 0.0}
+        return {
+            'questions': len(results),
+            'recall_at_k': float(np.mean([r['recall'] for r in results])),
+            'mrr': float(np.mean([r['reciprocal_rank'] for r in results]))
+        }
+    
     def get_performance_summary(self) -> Dict:
         """Get overall performance summary"""
-        if not self.metrics:
+        with self._lock:
+            metrics = list(self.metrics)
+        
+        if not metrics:
             return {
                 'total_queries': 0,
                 'average_response_time': 0,
@@ -162,10 +237,10 @@ class RAGEvaluator:
             }
         
         # Calculate averages
-        avg_response_time = np.mean([m['response_time'] for m in self.metrics])
-        avg_relevance = np.mean([m['relevance_score'] for m in self.metrics])
-        avg_consistency = np.mean([m['factual_consistency'] for m in self.metrics])
-        avg_completeness = np.mean([m['completeness'] for m in self.metrics])
+        avg_response_time = np.mean([m['response_time'] for m in metrics])
+        avg_relevance = np.mean([m['relevance_score'] for m in metrics])
+        avg_consistency = np.mean([m['factual_consistency'] for m in metrics])
+        avg_completeness = np.mean([m['completeness'] for m in metrics])
         
         cache_hit_rate = self.cache_hits / self.total_queries if self.total_queries > 0 else 0
         
@@ -176,15 +251,17 @@ class RAGEvaluator:
             'average_relevance': avg_relevance,
             'average_consistency': avg_consistency,
             'average_completeness': avg_completeness,
-            'total_metrics_recorded': len(self.metrics)
+            'total_metrics_recorded': len(metrics)
         }
     
     def get_recent_performance(self, hours: int = 24) -> Dict:
         """Get performance for recent time period"""
         cutoff_time = datetime.now().timestamp() - (hours * 3600)
+        with self._lock:
+            metrics = list(self.metrics)
         
         recent_metrics = [
-            m for m in self.metrics 
+            m for m in metrics 
             if datetime.fromisoformat(m['timestamp']).timestamp() > cutoff_time
         ]
         
@@ -198,6 +275,12 @@ class RAGEvaluator:
             'recent_avg_consistency': np.mean([m['factual_consistency'] for m in recent_metrics])
         }
     
+    def get_query_history(self) -> List[Tuple[str, float]]:
+        """Every recorded query with its Unix timestamp, oldest first"""
+        with self._lock:
+            metrics = list(self.metrics)
+        return [(m['query'], datetime.fromisoformat(m['timestamp']).timestamp()) for m in metrics]
+    
     def generate_report(self) -> str:
         """Generate a performance report"""
         summary = self.get_performance_summary()
@@ -241,6 +324,7 @@ Recommendations:
     
     def clear_metrics(self):
         """Clear all metrics"""
-        self.metrics = []
+        with self._lock:
+            self.metrics = []
         self._save_metrics()
         print("��️ Metrics cleared") 
\ No newline at end of file
@@ -0,0 +1,288 @@
+"""Replayable load test for the Flask endpoints (/upload, /ask, /metrics).
+
+Usage:
+    # Synthetic traffic in-process, 8 concurrent clients, 60% repeated questions
+    python loadtest.py --synthetic 500 --concurrency 8 --hit-ratio 0.6 --output results.json
+
+    # Replay a recorded log against a running server and compare with a baseline
+    python loadtest.py --log traffic.jsonl --url http://localhost:5001 --compare results.json
+
+Request logs are JSONL, one request per line:
+    {"endpoint": "/upload", "file": "document/sample.txt"}
+    {"endpoint": "/ask", "question": "What is deep learning?"}
+    {"endpoint": "/metrics"}
+
+In-process runs use Flask's test client inside a fresh temporary working directory,
+so the cache, metrics, uploads and index of the checkout are left untouched.
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import re
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List
+import numpy as np
+from embeddings import DEFAULT_BACKEND
+from vector_store import STORAGE_DTYPE
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def load_log(path: str) -> List[Dict]:
+    """Read a JSONL request log"""
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def synthetic_log(docs_dir: str, count: int, hit_ratio: float, metrics_ratio: float,
+                  upload_ratio: float, seed: int = 0) -> List[Dict]:
+    """Generate traffic from the corpus: repeated questions hit the cache, fresh ones miss"""
+    rng = random.Random(seed)
+    paths = sorted(glob.glob(os.path.join(docs_dir, "*.txt")))
+    sentences = []
+    for path in paths:
+        with open(path) as f:
+            text = re.sub(r"\s+", " ", f.read())
+        sentences.extend(s.strip() for s in re.split(r"(?<=[\.\!\?])\s", text) if len(s.split()) >= 4)
+    if not sentences:
+        raise ValueError(f"No sentences found in {docs_dir}")
+
+    templates = ["What does the document say about {}?", "Explain {}", "Tell me about {}", "{}"]
+    log = [{'endpoint': '/upload', 'file': path} for path in paths]
+    asked = []
+    for _ in range(count):
+        roll = rng.random()
+        if roll < metrics_ratio:
+            log.append({'endpoint': '/metrics'})
+        elif roll < metrics_ratio + upload_ratio:
+            log.append({'endpoint': '/upload', 'file': rng.choice(paths)})
+        elif asked and rng.random() < hit_ratio:
+            log.append({'endpoint': '/ask', 'question': rng.choice(asked)})
+        else:
+            words = rng.choice(sentences).rstrip(".!?").split()
+            start = rng.randrange(max(len(words) - 6, 1))
+            question = rng.choice(templates).format(" ".join(words[start:start + rng.randint(3, 8)]))
+            asked.append(question)
+            log.append({'endpoint': '/ask', 'question': question})
+    return log
+
+class InProcessClient:
+    """Drives app.py through Flask's test client, one client per thread"""
+
+    def __init__(self, workdir: str):
+        # app.py creates ./cache, ./metrics, ./uploads and ./vectordb relative to the working directory
+        os.chdir(workdir)
+        from app import app
+        self.app = app
+        self._local = threading.local()
+
+    def _client(self):
+        if not hasattr(self._local, 'client'):
+            self._local.client = self.app.test_client()
+        return self._local.client
+
+    def request(self, record: Dict):
+        client = self._client()
+        endpoint = record['endpoint']
+        if endpoint == '/upload':
+            with open(record['file'], 'rb') as f:
+                response = client.post('/upload', data={'file': (f, os.path.basename(record['file']))},
+                                       content_type='multipart/form-data')
+        elif endpoint == '/ask':
+            response = client.post('/ask', json={'question': record['question']})
+        else:
+            response = client.get(endpoint)
+        return response.status_code, response.get_json(silent=True) or {}
+
+class HttpClient:
+    """Drives a running server over HTTP with the standard library"""
+
+    def __init__(self, base_url: str, timeout: float = 60):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def _send(self, req):
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                return response.status, json.loads(response.read() or b'{}')
+        except urllib.error.HTTPError as e:
+            body = e.read()
+            try:
+                return e.code, json.loads(body or b'{}')
+            except ValueError:
+                return e.code, {}
+
+    def request(self, record: Dict):
+        endpoint = record['endpoint']
+        url = self.base_url + endpoint
+        if endpoint == '/upload':
+            boundary = uuid.uuid4().hex
+            with open(record['file'], 'rb') as f:
+                content = f.read()
+            body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; '
+                    f'filename="{os.path.basename(record["file"])}"\r\nContent-Type: text/plain\r\n\r\n').encode()
+            body += content + f'\r\n--{boundary}--\r\n'.encode()
+            req = urllib.request.Request(url, data=body, method='POST',
+                                         headers={'Content-Type': f'multipart/form-data; boundary={boundary}'})
+        elif endpoint == '/ask':
+            req = urllib.request.Request(url, data=json.dumps({'question': record['question']}).encode(),
+                                         method='POST', headers={'Content-Type': 'application/json'})
+        else:
+            req = urllib.request.Request(url)
+        return self._send(req)
+
+def is_error(status: int, body: Dict) -> bool:
+    """The app reports most failures as 200 responses with an error field"""
+    return status >= 400 or 'error' in body or body.get('success') is False
+
+def replay(client, log: List[Dict], concurrency: int) -> Dict:
+    """Send every request, uploads first in order, then the rest concurrently"""
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    statuses = defaultdict(lambda: defaultdict(int))
+    cache_hits = 0
+    lock = threading.Lock()
+
+    def send(record, label=None):
+        nonlocal cache_hits
+        start = time.perf_counter()
+        try:
+            status, body = client.request(record)
+        except Exception as e:
+            status, body = 0, {'error': str(e)}
+        elapsed = time.perf_counter() - start
+        with lock:
+            endpoint = label or record['endpoint']
+            samples[endpoint].append(elapsed)
+            statuses[endpoint][status] += 1
+            if is_error(status, body):
+                errors[endpoint] += 1
+            if body.get('cached'):
+                cache_hits += 1
+
+    # Initial uploads populate the index before any question is asked; they are reported separately
+    leading = 0
+    while leading < len(log) and log[leading]['endpoint'] == '/upload':
+        send(log[leading], label='/upload (setup)')
+        leading += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, log[leading:]))
+    wall_time = time.perf_counter() - start
+
+    endpoints = {}
+    for endpoint, times in samples.items():
+        ms = np.array(times) * 1000
+        endpoints[endpoint] = {
+            'requests': len(times),
+            'errors': errors[endpoint],
+            'statuses': {str(code): n for code, n in statuses[endpoint].items()},
+            'req_per_sec': len(times) / sum(times) if endpoint.endswith('(setup)') else len(times) / wall_time,
+            'p50_ms': float(np.percentile(ms, 50)),
+            'p95_ms': float(np.percentile(ms, 95)),
+            'p99_ms': float(np.percentile(ms, 99)),
+            'max_ms': float(ms.max())
+        }
+    asks = samples.get('/ask', [])
+    return {
+        'wall_time_s': wall_time,
+        'total_req_per_sec': (len(log) - leading) / wall_time if wall_time > 0 else 0.0,
+        'ask_cache_hit_rate': cache_hits / len(asks) if asks else 0.0,
+        'endpoints': endpoints
+    }
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=SCRIPT_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return "unknown"
+
+def print_results(results: Dict, baseline: Dict = None):
+    print(f"\n{'endpoint':<16}{'reqs':>7}{'errors':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for endpoint, r in sorted(results['endpoints'].items()):
+        print(f"{endpoint:<16}{r['requests']:>7}{r['errors']:>8}{r['req_per_sec']:>9.1f}"
+              f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}")
+        if baseline and endpoint in baseline['endpoints']:
+            b = baseline['endpoints'][endpoint]
+            deltas = [(r[key] - b[key]) / b[key] if b[key] else 0.0
+                      for key in ('req_per_sec', 'p50_ms', 'p95_ms', 'p99_ms')]
+            print(f"{'  vs base':<16}{'':>15}{deltas[0]:>+9.1%}{deltas[1]:>+10.1%}{deltas[2]:>+10.1%}{deltas[3]:>+10.1%}")
+    print(f"\nTotal: {results['total_req_per_sec']:.1f} req/s over {results['wall_time_s']:.1f}s, "
+          f"/ask cache hit rate {results['ask_cache_hit_rate']:.1%}")
+    if baseline:
+        print(f"Baseline: revision {baseline['config'].get('revision')} at {baseline['config'].get('timestamp')}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the RAG Flask endpoints")
+    parser.add_argument("--log", help="JSONL request log to replay (default: synthetic traffic)")
+    parser.add_argument("--url", help="Base URL of a running server (default: in-process test client)")
+    parser.add_argument("--docs", default=os.path.join(SCRIPT_DIR, "document"))
+    parser.add_argument("--synthetic", type=int, default=200, help="Number of synthetic requests")
+    parser.add_argument("--hit-ratio", type=float, default=0.5, help="Share of /ask requests repeating a question")
+    parser.add_argument("--metrics-ratio", type=float, default=0.05)
+    parser.add_argument("--upload-ratio", type=float, default=0.0)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--record", help="Write the generated synthetic log to this path for later replay")
+    parser.add_argument("--output", help="Write machine-readable results to this JSON file")
+    parser.add_argument("--compare", help="Baseline results JSON to compare against")
+    args = parser.parse_args()
+
+    if args.log:
+        log = load_log(args.log)
+    else:
+        log = synthetic_log(args.docs, args.synthetic, args.hit_ratio, args.metrics_ratio,
+                            args.upload_ratio, args.seed)
+    # Resolve file paths before an in-process run changes directory
+    for record in log:
+        if 'file' in record:
+            record['file'] = os.path.abspath(record['file'])
+    if args.record:
+        with open(args.record, 'w') as f:
+            f.writelines(json.dumps(record) + "\n" for record in log)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    output = os.path.abspath(args.output) if args.output else None
+
+    if args.url:
+        client = HttpClient(args.url)
+    else:
+        client = InProcessClient(tempfile.mkdtemp(prefix="rag-loadtest-"))
+
+    print(f"Replaying {len(log)} requests at concurrency {args.concurrency} "
+          f"({'HTTP ' + args.url if args.url else 'in-process'})")
+    results = replay(client, log, args.concurrency)
+    results['config'] = {
+        'revision': git_revision(),
+        'timestamp': datetime.now().isoformat(),
+        'mode': 'http' if args.url else 'in-process',
+        'log': args.log or 'synthetic',
+        'requests': len(log),
+        'concurrency': args.concurrency,
+        'hit_ratio': None if args.log else args.hit_ratio,
+        'embedding_backend': DEFAULT_BACKEND,
+        'storage_dtype': STORAGE_DTYPE
+    }
+    print_results(results, baseline)
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {output}")
+
+if __name__ == "__main__":
+    main()
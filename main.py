@@ -1,9 +1,52 @@
 from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.document_loaders import TextLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
+from embeddings import get_embedding_backend
+from vector_store import CompactVectorStore, STORAGE_DTYPE, add_precomputed_embeddings
+from sharding import ShardedVectorStore, NUM_SHARDS
+from dedup import ChunkDeduplicator, DEFAULT_NAMESPACE
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import glob
+import json
+import numpy as np
 import os
+import pickle
 import re
+import shutil
+import time
+import uuid
+
+# "chroma" keeps float32 vectors in ./vectordb; "compact" holds float16/int8 vectors in memory;
+# "sharded" splits compact storage across RAG_NUM_SHARDS worker processes searched in parallel
+VECTOR_STORE = os.environ.get("RAG_VECTOR_STORE", "chroma" if STORAGE_DTYPE == "float32" else "compact")
+PERSIST_DIRECTORY = "./vectordb"
+
+# Files written next to the vector store by save_index
+INDEX_FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+COMPACT_STORE_FILE = "compact_store.pkl"
+SHARDED_STORE_FILE = "sharded_store.pkl"
+DEDUP_FILE = "dedup.pkl"
+# Directories holding the store files of an imported snapshot, linked from the bundle
+IMPORTED_STORE_PREFIX = "imported_store_"
+# Uploads between full saves are appended here, one file per upload, and replayed on load
+APPEND_LOG_DIR = "appended"
+# The log is folded into a full save once it holds more chunks than the base (and at least this many)
+MIN_COMPACTION_CHUNKS = int(os.environ.get("RAG_MIN_COMPACTION_CHUNKS", "1000"))
+
+# Chunking parameters shared by every ingestion path
+CHUNK_SIZE = 800  # Larger chunks for better context
+CHUNK_OVERLAP = 100  # More overlap to maintain context
+CHUNK_SEPARATORS = ["\n\n", "\n", ". ", "! ", "? ", "; ", ": ", ", ", " ", ""]
+
+# Uploads without a collection name go here; collections are separate namespaces in one vector store
+DEFAULT_COLLECTION = DEFAULT_NAMESPACE
+
+# MMR retrieval parameters shared by single and batched question answering
+RETRIEVAL_K = 6  # Get more candidates
+RETRIEVAL_FETCH_K = 15  # Fetch more for MMR selection
+RETRIEVAL_LAMBDA_MULT = 0.8  # Balance relevance vs diversity
 
 def preprocess_text(text):
     """Clean and preprocess text for better chunking"""
@@ -13,10 +56,35 @@ def preprocess_text(text):
     text = re.sub(r'[^\w\s\.\,\!\?\;\:\-\(\)]', '', text)
     return text.strip()
 
-def create_new_vectordb(filepath, filename):
-    """Create a new vector database from a document"""
-    print(f"Creating new vector database with document: {filename}")
-    
+def split_documents(documents, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """Split loaded documents into chunks with RecursiveCharacterTextSplitter"""
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=CHUNK_SEPARATORS,
+        length_function=len
+    )
+    return text_splitter.split_documents(documents)
+
+def chunk_ids(texts):
+    """Ids assigned by the deduplicator, or None to let the store generate them"""
+    ids = [doc.metadata.get('chunk_id') for doc in texts]
+    return ids if all(ids) else None
+
+def build_vectordb(texts, embeddings):
+    """Create the configured vector store from split chunks"""
+    if VECTOR_STORE == "compact":
+        return CompactVectorStore.from_documents(texts, embeddings, ids=chunk_ids(texts), dtype=STORAGE_DTYPE)
+    if VECTOR_STORE == "sharded":
+        return ShardedVectorStore.from_documents(texts, embeddings, ids=chunk_ids(texts),
+                                                 num_shards=NUM_SHARDS, dtype=STORAGE_DTYPE)
+    # A fresh collection, so a cleared one that is still being retired is never reused
+    return Chroma.from_documents(texts, embeddings, ids=chunk_ids(texts), persist_directory=PERSIST_DIRECTORY,
+                                 collection_name=f"index_{uuid.uuid4().hex[:12]}")
+
+def load_document_chunks(filepath, filename, collection=DEFAULT_COLLECTION, chunk_size=CHUNK_SIZE,
+                         chunk_overlap=CHUNK_OVERLAP):
+    """Load, clean and split a document into chunks tagged with its source and collection"""
     # Load the document
     loader = TextLoader(filepath)
     documents = loader.load()
@@ -33,76 +101,70 @@ def create_new_vectordb(filepath, filename):
         doc.metadata['source'] = filename
         doc.metadata['filepath'] = filepath
         doc.metadata['document_type'] = 'text'
+        doc.metadata['collection'] = collection
     
     # Better text splitting with RecursiveCharacterTextSplitter
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=800,  # Larger chunks for better context
-        chunk_overlap=100,  # More overlap to maintain context
-        separators=["\n\n", "\n", ". ", "! ", "? ", "; ", ": ", ", ", " ", ""],
-        length_function=len
-    )
-    texts = text_splitter.split_documents(documents)
+    texts = split_documents(documents, chunk_size, chunk_overlap)
     
     # Validate that we have chunks
     if not texts:
         raise ValueError(f"Document '{filename}' could not be split into meaningful chunks")
     
     print(f"Split into {len(texts)} text chunks")
+    return texts
+
+def create_new_vectordb(filepath, filename, deduplicator=None, collection=DEFAULT_COLLECTION):
+    """Create a new vector database from a document"""
+    print(f"Creating new vector database with document: {filename}")
+    texts = load_document_chunks(filepath, filename, collection)
     
-    # Load embeddings
-    print("Loading embeddings model...")
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-MiniLM-L6-v2",
-        model_kwargs={'device': 'cpu'}
-    )
+    # Drop near-duplicate chunks before they are embedded
+    if deduplicator is not None:
+        texts, _ = deduplicator.deduplicate(texts, filename, namespace=collection)
     
-    # Create vector DB
-    print("Creating vector database...")
-    vectordb = Chroma.from_documents(texts, embeddings, persist_directory="./vectordb")
+    try:
+        # Load embeddings
+        print("Loading embeddings model...")
+        embeddings = get_embedding_backend()
+        
+        # Create vector DB
+        print("Creating vector database...")
+        vectordb = build_vectordb(texts, embeddings)
+    except Exception:
+        # The chunks never reached a store, so they must not count as indexed on retry
+        if deduplicator is not None:
+            deduplicator.rollback()
+        raise
     
     print("✅ New vector database created successfully!")
     return vectordb
 
-def add_document_to_vectordb(vectordb, filepath, filename):
-    """Add a document to an existing vector database"""
+def add_document_to_vectordb(vectordb, filepath, filename, deduplicator=None, collection=DEFAULT_COLLECTION):
+    """Add a document to an existing vector database, returning the added chunks and their vectors"""
     print(f"Adding document to existing vector database: {filename}")
-    
-    # Load the document
-    loader = TextLoader(filepath)
-    documents = loader.load()
-    
-    # Validate that we have content
-    if not documents or not documents[0].page_content.strip():
-        raise ValueError(f"Document '{filename}' is empty or contains no readable text")
-    
-    # Preprocess the text
-    documents[0].page_content = preprocess_text(documents[0].page_content)
-    
-    # Add metadata to identify the source document
-    for doc in documents:
-        doc.metadata['source'] = filename
-        doc.metadata['filepath'] = filepath
-        doc.metadata['document_type'] = 'text'
-    
-    # Better text splitting with RecursiveCharacterTextSplitter
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=800,  # Larger chunks for better context
-        chunk_overlap=100,  # More overlap to maintain context
-        separators=["\n\n", "\n", ". ", "! ", "? ", "; ", ": ", ", ", " ", ""],
-        length_function=len
-    )
-    texts = text_splitter.split_documents(documents)
-    
-    # Validate that we have chunks
-    if not texts:
-        raise ValueError(f"Document '{filename}' could not be split into meaningful chunks")
-    
-    print(f"Split into {len(texts)} text chunks")
-    
-    # Add to existing vector database
-    vectordb.add_documents(texts)
+    texts = load_document_chunks(filepath, filename, collection)
+    
+    # Drop near-duplicate chunks before they are embedded
+    if deduplicator is not None:
+        texts, _ = deduplicator.deduplicate(texts, filename, namespace=collection)
+    
+    # Embed here rather than inside the store, so append_index can persist exactly these vectors
+    vectors = None
+    try:
+        if texts:
+            # Chunks need ids to be replayed from the log; the deduplicator has usually assigned them
+            for doc in texts:
+                doc.metadata.setdefault('chunk_id', uuid.uuid4().hex)
+            contents = [doc.page_content for doc in texts]
+            vectors = vectordb.embeddings.encode(contents)
+            add_precomputed_embeddings(vectordb, contents, vectors, [doc.metadata for doc in texts], chunk_ids(texts))
+    except Exception:
+        if deduplicator is not None:
+            deduplicator.rollback()
+        raise
     
     print("✅ Document added to vector database successfully!")
+    return texts, vectors
 
 def load_and_process_document(filepath):
     """Load and process a document, returning the vector database"""
@@ -122,13 +184,7 @@ def load_and_process_document(filepath):
     print(f"Original document length: {len(documents[0].page_content)} characters")
     
     # Better text splitting
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=800,  # Larger chunks for better context
-        chunk_overlap=100,  # More overlap to maintain context
-        separators=["\n\n", "\n", ". ", "! ", "? ", "; ", ": ", ", ", " ", ""],
-        length_function=len
-    )
-    texts = text_splitter.split_documents(documents)
+    texts = split_documents(documents)
     
     # Validate that we have chunks
     if not texts:
@@ -138,37 +194,84 @@ def load_and_process_document(filepath):
     
     # Load embeddings
     print("Loading embeddings model...")
-    embeddings = HuggingFaceEmbeddings(
-        model_name="sentence-transformers/all-MiniLM-L6-v2",
-        model_kwargs={'device': 'cpu'}
-    )
+    embeddings = get_embedding_backend()
     
     # Create vector DB
     print("Creating vector database...")
-    vectordb = Chroma.from_documents(texts, embeddings, persist_directory="./vectordb")
+    vectordb = build_vectordb(texts, embeddings)
     
     print("✅ Document processed successfully!")
     return vectordb
 
-def ask_question(question, vectordb, documents=None):
-    """Ask a question and get a response from the RAG system"""
-    if not vectordb:
-        return "No documents loaded. Please upload at least one document first."
-    
-    print(f"Processing question: {question}")
-    
+def collection_documents(documents, collection=None):
+    """Documents in a collection (all documents when collection is None)"""
+    if collection is None:
+        return list(documents)
+    return [doc for doc in documents if doc.get('collection', DEFAULT_COLLECTION) == collection]
+
+def build_filter(collection=None, sources=None, deduplicator=None):
+    """Metadata filter restricting retrieval to a collection and/or source documents, or None for no restriction"""
+    clauses = []
+    if collection is not None:
+        clauses.append({"collection": collection})
+    if sources:
+        source_clause = {"source": {"$in": list(sources)}}
+        # Chunks these documents shared with an earlier upload are stored once, under that upload's name
+        shared = deduplicator.shared_chunk_ids(sources) if deduplicator is not None else []
+        if shared:
+            source_clause = {"$or": [source_clause, {"chunk_id": {"$in": shared}}]}
+        clauses.append(source_clause)
+    
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+def retrieve_documents(question, vectordb, filter=None, k=RETRIEVAL_K, fetch_k=RETRIEVAL_FETCH_K,
+                       lambda_mult=RETRIEVAL_LAMBDA_MULT):
+    """Ranked chunks for a question, using MMR with the given (default: production) parameters"""
     # Enhanced retrieval with better parameters
+    search_kwargs = {
+        "k": k,
+        "fetch_k": fetch_k,
+        "lambda_mult": lambda_mult
+    }
+    if filter:
+        # Pushed down into the store so only matching chunks are scored
+        search_kwargs["filter"] = filter
     retriever = vectordb.as_retriever(
         search_type="mmr",  # Maximum Marginal Relevance for diversity
-        search_kwargs={
-            "k": 6,  # Get more candidates
-            "fetch_k": 15,  # Fetch more for MMR selection
-            "lambda_mult": 0.8  # Balance relevance vs diversity
-        }
+        search_kwargs=search_kwargs
     )
+    return retriever.invoke(question)
+
+def ask_question(question, vectordb, documents=None, deduplicator=None, filter=None):
+    """Ask a question and get a response from the RAG system"""
+    if not vectordb:
+        return "No documents loaded. Please upload at least one document first."
     
-    relevant_docs = retriever.invoke(question)
+    print(f"Processing question: {question}")
     
+    relevant_docs = retrieve_documents(question, vectordb, filter)
+    return format_answer(relevant_docs, documents, deduplicator)
+
+def ask_questions(questions, vectordb, documents=None, deduplicator=None, filter=None):
+    """Answer a batch of questions, embedding them in one call instead of one model pass each"""
+    if not vectordb:
+        return ["No documents loaded. Please upload at least one document first."] * len(questions)
+    
+    query_embeddings = vectordb.embeddings.embed_documents(list(questions))
+    search_kwargs = {"filter": filter} if filter else {}
+    answers = []
+    for query_embedding in query_embeddings:
+        relevant_docs = vectordb.max_marginal_relevance_search_by_vector(
+            query_embedding, k=RETRIEVAL_K, fetch_k=RETRIEVAL_FETCH_K, lambda_mult=RETRIEVAL_LAMBDA_MULT,
+            **search_kwargs
+        )
+        answers.append(format_answer(relevant_docs, documents, deduplicator))
+    return answers
+
+def format_answer(relevant_docs, documents=None, deduplicator=None):
+    """Format retrieved chunks as an answer grouped by source document"""
     if not relevant_docs:
         return "I couldn't find any relevant information in your documents to answer your question."
     
@@ -187,14 +290,21 @@ def ask_question(question, vectordb, documents=None):
     sorted_sources = sorted(docs_by_source.items(), key=lambda x: len(x[1]), reverse=True)
     
     # Extract key information and format it professionally
+    seen_content = set()
     for source, docs in sorted_sources:
         response += f"📄 **From: {source}**\n"
         # Combine content from same source to avoid repetition
         combined_content = ""
         for doc in docs:
             content = doc.page_content.strip()
-            if content and content not in combined_content:
+            if content and content not in seen_content:
+                seen_content.add(content)
                 combined_content += content + "\n\n"
+                # Near-duplicates were collapsed at ingest, so list the other documents that had this text
+                if deduplicator is not None:
+                    also_in = [other for other in deduplicator.sources_for(doc.metadata.get('chunk_id')) if other != source]
+                    if also_in:
+                        combined_content += f"*Also found in: {', '.join(also_in)}*\n\n"
         
         if combined_content:
             response += combined_content
@@ -209,24 +319,351 @@ def ask_question(question, vectordb, documents=None):
     
     return response
 
-# Interactive CLI version (original functionality)
-if __name__ == "__main__":
+def extract_sources(answer):
+    """Source document names cited in a formatted answer"""
+    return re.findall(r"📄 \*\*From: ([^*]+)\*\*", answer)
+
+def open_vectordb(persist_directory=PERSIST_DIRECTORY, embeddings=None, collection_name=None):
+    """Open an empty (or existing Chroma) vector store of the configured type"""
+    embeddings = embeddings or get_embedding_backend()
+    if VECTOR_STORE == "compact":
+        return CompactVectorStore(embeddings, dtype=STORAGE_DTYPE)
+    if VECTOR_STORE == "sharded":
+        return ShardedVectorStore(embeddings, num_shards=NUM_SHARDS, dtype=STORAGE_DTYPE)
+    return open_chroma(persist_directory, embeddings, collection_name)
+
+def open_chroma(persist_directory, embeddings, collection_name=None):
+    """Open a Chroma collection, the default one unless a name is given"""
+    kwargs = {'collection_name': collection_name} if collection_name else {}
+    return Chroma(persist_directory=persist_directory, embedding_function=embeddings, **kwargs)
+
+def store_type(vectordb):
+    """Name of the vector store implementation, as recorded in the manifest"""
+    if isinstance(vectordb, ShardedVectorStore):
+        return "sharded"
+    if isinstance(vectordb, CompactVectorStore):
+        return "compact"
+    return "chroma"
+
+def save_index(vectordb, documents, deduplicator=None, persist_directory=PERSIST_DIRECTORY, snapshot=None):
+    """Persist the vector store, document list and dedup state so another process can load them.
+
+    snapshot (import_snapshot's stats) marks an in-memory store that still matches the bundle
+    files import_snapshot linked into persist_directory; those are kept instead of a full copy.
+    """
+    os.makedirs(persist_directory, exist_ok=True)
+    store_file = {'compact': COMPACT_STORE_FILE, 'sharded': SHARDED_STORE_FILE}.get(store_type(vectordb))
+    
+    # Chroma persists itself; the in-memory stores are written next to it
+    if store_file and snapshot is None:
+        vectordb.save(os.path.join(persist_directory, store_file))
+    elif store_file and os.path.exists(os.path.join(persist_directory, store_file)):
+        os.remove(os.path.join(persist_directory, store_file))
+    
+    if deduplicator is not None:
+        with open(os.path.join(persist_directory, DEDUP_FILE), 'wb') as f:
+            pickle.dump(deduplicator, f)
+    
+    manifest = {
+        'version': INDEX_FORMAT_VERSION,
+        'vector_store': store_type(vectordb),
+        'embedding_backend': vectordb.embeddings.name,
+        'storage_dtype': getattr(vectordb, 'dtype', "float32"),
+        'chunk_size': CHUNK_SIZE,
+        'chunk_overlap': CHUNK_OVERLAP,
+        'documents': documents,
+        'updated_at': time.time()
+    }
+    if store_type(vectordb) == "chroma":
+        manifest['chroma_collection'] = vectordb._collection.name
+    elif snapshot is not None:
+        manifest['snapshot'] = {'directory': os.path.basename(snapshot['directory']),
+                                'source': os.path.abspath(snapshot['path']), 'created_at': snapshot['created_at']}
+    # Appended uploads are now part of the base files; start a new log generation for later ones
+    manifest['base_chunks'] = count_chunks(vectordb)
+    manifest['log'] = {'generation': uuid.uuid4().hex, 'files': 0, 'chunks': 0}
+    write_manifest(manifest, persist_directory)
+    shutil.rmtree(os.path.join(persist_directory, APPEND_LOG_DIR), ignore_errors=True)
+    
+    # Store files of earlier imports are no longer referenced (a store still serving keeps its mapping)
+    current = manifest.get('snapshot', {}).get('directory')
+    remove_imported_stores(persist_directory, keep=current)
+
+def count_chunks(vectordb):
+    """Number of chunks in any store type"""
+    if hasattr(vectordb, 'get_stats'):
+        return vectordb.get_stats()['chunks']
+    return vectordb._collection.count()
+
+def write_manifest(manifest, persist_directory=PERSIST_DIRECTORY):
+    """Replace the index manifest atomically, so a crash never leaves a half-written one"""
+    path = os.path.join(persist_directory, MANIFEST_FILE)
+    with open(path + ".tmp", 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+def append_index(vectordb, documents, deduplicator, texts, vectors, persist_directory=PERSIST_DIRECTORY):
+    """Persist one upload's chunks as a new log file instead of re-saving the whole index.
+
+    Falls back to a full save_index (which folds the log into the base files) when there is no
+    log to append to, or once the appended chunks outnumber the base so replay stays cheap.
+    """
+    manifest_path = os.path.join(persist_directory, MANIFEST_FILE)
+    manifest = None
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    texts = texts or []
+    if (manifest is None or 'log' not in manifest or manifest['vector_store'] != store_type(vectordb)
+            or manifest['log']['chunks'] + len(texts) > max(manifest['base_chunks'], MIN_COMPACTION_CHUNKS)):
+        save_index(vectordb, documents, deduplicator, persist_directory)
+        return
+    
+    log = manifest['log']
+    log_dir = os.path.join(persist_directory, APPEND_LOG_DIR)
+    os.makedirs(log_dir, exist_ok=True)
+    entry = {
+        'ids': chunk_ids(texts) or [],
+        'texts': [doc.page_content for doc in texts],
+        'metadatas': [doc.metadata for doc in texts],
+        # Chroma persists its own vectors; only the in-memory stores need them in the log
+        'vectors': None if store_type(vectordb) == "chroma" or not texts else np.asarray(vectors, dtype=np.float32),
+        'dedup': deduplicator.export_changes() if deduplicator is not None else []
+    }
+    path = os.path.join(log_dir, f"{log['generation']}-{log['files'] + 1:06d}.pkl")
+    with open(path + ".tmp", 'wb') as f:
+        pickle.dump(entry, f)
+    os.replace(path + ".tmp", path)
+    
+    # The manifest only counts the file once it is complete, so a crash mid-write is never replayed
+    log['files'] += 1
+    log['chunks'] += len(texts)
+    manifest['documents'] = documents
+    manifest['updated_at'] = time.time()
+    write_manifest(manifest, persist_directory)
+
+def replay_index_log(vectordb, deduplicator, manifest, persist_directory=PERSIST_DIRECTORY):
+    """Apply the uploads append_index logged since the last full save, returning the deduplicator"""
+    log = manifest.get('log') or {'files': 0}
+    for seq in range(1, log['files'] + 1):
+        with open(os.path.join(persist_directory, APPEND_LOG_DIR, f"{log['generation']}-{seq:06d}.pkl"), 'rb') as f:
+            entry = pickle.load(f)
+        if entry['vectors'] is not None and entry['texts']:
+            add_precomputed_embeddings(vectordb, entry['texts'], entry['vectors'], entry['metadatas'],
+                                       entry['ids'] or None)
+        if entry['dedup']:
+            deduplicator = deduplicator or ChunkDeduplicator()
+            deduplicator.apply_changes(entry['dedup'])
+    return deduplicator
+
+def remove_imported_stores(persist_directory=PERSIST_DIRECTORY, keep=None):
+    """Delete imported snapshot store directories other than keep"""
+    for path in glob.glob(os.path.join(persist_directory, IMPORTED_STORE_PREFIX + "*")):
+        if os.path.basename(path) != keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+def load_index(persist_directory=PERSIST_DIRECTORY):
+    """Load an index written by save_index as (vectordb, documents, deduplicator), or None if there is none"""
+    manifest_path = os.path.join(persist_directory, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    if manifest.get('version') != INDEX_FORMAT_VERSION:
+        raise ValueError(f"Unsupported index format version {manifest.get('version')} in {persist_directory}")
+    
+    # Queries must be embedded with the backend the index was built with
+    embeddings = get_embedding_backend(manifest['embedding_backend'])
+    if manifest.get('snapshot'):
+        # Imported from a bundle and unchanged since: map the store files linked into this directory
+        from snapshot import read_manifest, open_snapshot
+        local = os.path.join(persist_directory, manifest['snapshot']['directory'])
+        vectordb = open_snapshot(local, read_manifest(local), manifest['vector_store'], persist_directory)
+    elif manifest['vector_store'] == "compact":
+        vectordb = CompactVectorStore.load(os.path.join(persist_directory, COMPACT_STORE_FILE), embeddings)
+    elif manifest['vector_store'] == "sharded":
+        vectordb = ShardedVectorStore.load(os.path.join(persist_directory, SHARDED_STORE_FILE), embeddings)
+    else:
+        vectordb = open_chroma(persist_directory, embeddings, manifest.get('chroma_collection'))
+    
+    deduplicator = None
+    dedup_path = os.path.join(persist_directory, DEDUP_FILE)
+    if os.path.exists(dedup_path):
+        with open(dedup_path, 'rb') as f:
+            deduplicator = pickle.load(f)
+    deduplicator = replay_index_log(vectordb, deduplicator, manifest, persist_directory)
+    
+    print(f"📂 Loaded index with {len(manifest['documents'])} document(s) from {persist_directory}")
+    return vectordb, manifest['documents'], deduplicator
+
+def close_vectordb(vectordb):
+    """Release a store that is no longer served: drop its Chroma collection or stop its shard workers"""
+    if vectordb is None:
+        return
+    if store_type(vectordb) == "chroma":
+        vectordb.delete_collection()
+    elif store_type(vectordb) == "sharded":
+        vectordb.close()
+
+def clear_index(vectordb, persist_directory=PERSIST_DIRECTORY):
+    """Delete the persisted index so cleared documents do not come back on restart"""
+    close_vectordb(vectordb)
+    for name in (MANIFEST_FILE, COMPACT_STORE_FILE, SHARDED_STORE_FILE, DEDUP_FILE):
+        path = os.path.join(persist_directory, name)
+        if os.path.exists(path):
+            os.remove(path)
+    shutil.rmtree(os.path.join(persist_directory, APPEND_LOG_DIR), ignore_errors=True)
+    remove_imported_stores(persist_directory)
+
+def index_directory(directory, persist_directory=PERSIST_DIRECTORY, workers=4, pattern="*.txt", batch_size=256,
+                    collection=DEFAULT_COLLECTION):
+    """Ingest every matching file under directory into the persisted index, in parallel"""
+    paths = sorted(glob.glob(os.path.join(directory, "**", pattern), recursive=True))
+    if not paths:
+        raise ValueError(f"No files matching '{pattern}' found in {directory}")
+    
+    start_time = time.perf_counter()
+    existing = load_index(persist_directory)
+    if existing:
+        vectordb, documents, deduplicator = existing
+        deduplicator = deduplicator or ChunkDeduplicator()
+    else:
+        vectordb, documents, deduplicator = open_vectordb(persist_directory), [], ChunkDeduplicator()
+    embeddings = vectordb.embeddings
+    
+    # Re-running the command only ingests files that are not indexed yet
+    indexed_paths = {doc['path'] for doc in collection_documents(documents, collection)}
+    paths = [path for path in paths if path not in indexed_paths]
+    
+    def load(path):
+        try:
+            return path, load_document_chunks(path, os.path.relpath(path, directory), collection), None
+        except ValueError as e:
+            return path, [], str(e)
+    
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Loading and splitting is independent per file
+        loaded = list(pool.map(load, paths))
+        
+        # Dedup runs in file order so the same corpus always yields the same canonical chunks
+        texts, skipped, total_chunks = [], [], 0
+        for path, chunks, error in loaded:
+            if error:
+                print(f"⚠️ Skipping {path}: {error}")
+                skipped.append({'path': path, 'error': error})
+                continue
+            total_chunks += len(chunks)
+            unique, _ = deduplicator.deduplicate(chunks, chunks[0].metadata['source'], namespace=collection)
+            texts.extend(unique)
+            documents.append({
+                'id': str(uuid.uuid4()),
+                'name': chunks[0].metadata['source'],
+                'path': path,
+                'collection': collection
+            })
+        
+        # Embedding batches run concurrently; the model releases the GIL during inference
+        batches = [[doc.page_content for doc in texts[i:i + batch_size]] for i in range(0, len(texts), batch_size)]
+        embed_start = time.perf_counter()
+        vectors = list(pool.map(embeddings.encode, batches))
+        embed_time = time.perf_counter() - embed_start
+    
+    if texts:
+        add_precomputed_embeddings(
+            vectordb,
+            [doc.page_content for doc in texts],
+            np.vstack(vectors),
+            [doc.metadata for doc in texts],
+            chunk_ids(texts)
+        )
+    save_index(vectordb, documents, deduplicator, persist_directory)
+    
+    stats = {
+        'files': len(paths) - len(skipped),
+        'already_indexed': len(indexed_paths),
+        'skipped': skipped,
+        'chunks': total_chunks,
+        'indexed_chunks': len(texts),
+        'dedup_ratio': 1 - len(texts) / total_chunks if total_chunks else 0.0,
+        'embed_chunks_per_sec': len(texts) / embed_time if embed_time > 0 else 0.0,
+        'total_time_s': time.perf_counter() - start_time
+    }
+    print(f"✅ Indexed {stats['files']} file(s), {stats['indexed_chunks']}/{stats['chunks']} chunks "
+          f"({stats['dedup_ratio']:.1%} deduplicated) in {stats['total_time_s']:.1f}s")
+    return stats
+
+def query_file(questions_path, output_path, persist_directory=PERSIST_DIRECTORY):
+    """Answer every question in a JSONL file against the persisted index, writing answers with timings"""
+    index = load_index(persist_directory)
+    if index is None:
+        raise ValueError(f"No index found in {persist_directory}. Run the 'index' command first.")
+    vectordb, documents, deduplicator = index
+    
+    latencies = []
+    with open(questions_path) as fin, open(output_path, 'w') as fout:
+        for line_number, line in enumerate(fin, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            question = record.get('question') or record.get('query')
+            if not question:
+                print(f"⚠️ Line {line_number}: no 'question' field, skipping")
+                continue
+            
+            # Optional per-question scope, as accepted by /ask
+            collection = record.get('collection')
+            scope = collection_documents(documents, collection)
+            start = time.perf_counter()
+            answer = ask_question(question, vectordb, scope, deduplicator,
+                                  build_filter(collection, record.get('documents'), deduplicator))
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            latencies.append(elapsed_ms)
+            
+            fout.write(json.dumps({
+                'id': record.get('id', line_number),
+                'question': question,
+                'answer': answer,
+                'sources': extract_sources(answer),
+                'time_ms': elapsed_ms
+            }) + "\n")
+    
+    if latencies:
+        print(f"✅ Answered {len(latencies)} question(s): p50 {np.percentile(latencies, 50):.1f}ms, "
+              f"p95 {np.percentile(latencies, 95):.1f}ms, max {max(latencies):.1f}ms")
+    return latencies
+
+def run_snapshot(action, path, persist_directory=PERSIST_DIRECTORY, cache_dir=None):
+    """Export the persisted index to a snapshot bundle, or replace it with one"""
+    # Imported here because snapshot.py builds on the helpers in this module
+    from snapshot import export_snapshot, import_snapshot
+    from semantic_cache import SemanticCache
+    
+    index = load_index(persist_directory)
+    semantic_cache = SemanticCache(cache_dir=cache_dir) if cache_dir else None
+    if action == "export":
+        if index is None:
+            raise ValueError(f"No index found in {persist_directory}")
+        vectordb, documents, deduplicator = index
+        export_snapshot(path, vectordb, documents, deduplicator, semantic_cache)
+    else:
+        # The new store is complete before the old one is released, so a failed import changes nothing
+        vectordb, documents, deduplicator, stats = import_snapshot(path, semantic_cache, persist_directory)
+        save_index(vectordb, documents, deduplicator, persist_directory, snapshot=stats)
+        if index:
+            close_vectordb(index[0])
+
+def run_interactive(document_path):
+    """Interactive question loop over a single document (original functionality)"""
     # Load and split the document
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    document_path = os.path.join(script_dir, "document", "sample.txt")
     loader = TextLoader(document_path)
     documents = loader.load()
 
     print(f"Original document length: {len(documents[0].page_content)} characters")
 
     # Better text splitting
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=800,  # Larger chunks for better context
-        chunk_overlap=100,  # More overlap to maintain context
-        separators=["\n\n", "\n", ". ", "! ", "? ", "; ", ": ", ", ", " ", ""],
-        length_function=len
-    )
-    texts = text_splitter.split_documents(documents)
+    texts = split_documents(documents)
 
     print(f"Split into {len(texts)} text chunks")
     for i, text in enumerate(texts):
@@ -234,11 +671,11 @@ if __name__ == "__main__":
 
     # Load embeddings
     print("\nLoading embeddings model...")
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+    embeddings = get_embedding_backend()
 
     # Create vector DB
     print("Creating vector database...")
-    vectordb = Chroma.from_documents(texts, embeddings, persist_directory="./vectordb")
+    vectordb = build_vectordb(texts, embeddings)
 
     print("\nLoading system...")
     llm_available = False  # We'll use template-based responses instead
@@ -319,3 +756,46 @@ if __name__ == "__main__":
         except Exception as e:
             print(f"Error: {e}")
             print("Please try again.\n")
+
+
+def main(argv=None):
+    default_document = os.path.join(os.path.dirname(os.path.abspath(__file__)), "document", "sample.txt")
+    parser = argparse.ArgumentParser(description="RAG indexing and query tools")
+    subparsers = parser.add_subparsers(dest="command")
+    
+    index_parser = subparsers.add_parser("index", help="Ingest a directory of documents into the persisted index")
+    index_parser.add_argument("directory")
+    index_parser.add_argument("--persist-dir", default=PERSIST_DIRECTORY)
+    index_parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    index_parser.add_argument("--pattern", default="*.txt")
+    index_parser.add_argument("--batch-size", type=int, default=256)
+    index_parser.add_argument("--collection", default=DEFAULT_COLLECTION, help="Collection to add the files to")
+    
+    query_parser = subparsers.add_parser("query", help="Answer questions from a JSONL file")
+    query_parser.add_argument("questions", help="JSONL file with one {\"question\": ...} object per line")
+    query_parser.add_argument("--output", default="answers.jsonl")
+    query_parser.add_argument("--persist-dir", default=PERSIST_DIRECTORY)
+    
+    snapshot_parser = subparsers.add_parser("snapshot", help="Export or import a compact index snapshot")
+    snapshot_parser.add_argument("action", choices=["export", "import"])
+    snapshot_parser.add_argument("path", help="Snapshot bundle directory")
+    snapshot_parser.add_argument("--persist-dir", default=PERSIST_DIRECTORY)
+    snapshot_parser.add_argument("--cache-dir", help="Also export/import the semantic cache in this directory")
+    
+    interactive_parser = subparsers.add_parser("interactive", help="Ask questions about a single document")
+    interactive_parser.add_argument("document", nargs="?", default=default_document)
+    
+    args = parser.parse_args(argv)
+    if args.command == "index":
+        index_directory(args.directory, args.persist_dir, args.workers, args.pattern, args.batch_size,
+                        args.collection)
+    elif args.command == "query":
+        query_file(args.questions, args.output, args.persist_dir)
+    elif args.command == "snapshot":
+        run_snapshot(args.action, args.path, args.persist_dir, args.cache_dir)
+    else:
+        # No subcommand keeps the original interactive behaviour
+        run_interactive(getattr(args, 'document', default_document))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Sweep chunking and retrieval parameters against a golden question set and measure the trade-offs.
+
+Usage:
+    python parameter_sweep.py [--golden golden_set.jsonl] [--chunk-sizes 400 800 1200]
+                              [--chunk-overlaps 50 100] [--k 4 6] [--fetch-k 15 30]
+                              [--lambda-mult 0.5 0.8] [--output sweep.json]
+
+The golden set is JSONL, one question per line, with the passages that answer it:
+    {"id": "dl-cnn", "question": "What are CNNs specialized for?",
+     "passages": [{"source": "deep_learning.txt", "text": "Convolutional Neural Networks ..."}]}
+
+Each chunking configuration is ingested once into a fresh index of the configured
+store type; every retrieval configuration is then scored on it for recall@k, MRR
+and query latency.
+"""
+import argparse
+import glob
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from embeddings import get_embedding_backend
+from evaluation import RAGEvaluator
+from dedup import ChunkDeduplicator
+from main import (VECTOR_STORE, CHUNK_SIZE, CHUNK_OVERLAP, RETRIEVAL_K, RETRIEVAL_FETCH_K, RETRIEVAL_LAMBDA_MULT,
+                  load_document_chunks, open_vectordb, clear_index, chunk_ids, retrieve_documents)
+from vector_store import add_precomputed_embeddings
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def load_golden_set(path):
+    """Read golden questions as dicts with 'question' and a list of passage texts"""
+    golden = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                golden.append({'id': record.get('id', len(golden)), 'question': record['question'],
+                               'passages': [p['text'] if isinstance(p, dict) else p for p in record['passages']]})
+    return golden
+
+def build_index(paths, docs_dir, chunk_size, chunk_overlap, persist_directory, embeddings):
+    """Ingest the corpus the way the index command does, returning (vectordb, stats)"""
+    start = time.perf_counter()
+    deduplicator = ChunkDeduplicator()
+    texts = []
+    for path in paths:
+        chunks = load_document_chunks(path, os.path.relpath(path, docs_dir),
+                                      chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        texts.extend(deduplicator.deduplicate(chunks, chunks[0].metadata['source'])[0])
+
+    vectordb = open_vectordb(persist_directory, embeddings)
+    contents = [doc.page_content for doc in texts]
+    add_precomputed_embeddings(vectordb, contents, embeddings.encode(contents),
+                               [doc.metadata for doc in texts], chunk_ids(texts))
+    ingest_time = time.perf_counter() - start
+
+    # Vectors at the configured storage precision plus chunk text; Chroma reports no stats, so assume float32
+    store_stats = vectordb.get_stats() if hasattr(vectordb, 'get_stats') else {}
+    vector_bytes = store_stats.get('vector_bytes', len(texts) * embeddings.dimension * 4)
+    return vectordb, {
+        'chunks': len(texts),
+        'index_bytes': vector_bytes + sum(len(text.encode()) for text in contents),
+        'ingest_s': ingest_time
+    }
+
+def score_retrieval(vectordb, golden, evaluator, k, fetch_k, lambda_mult, min_coverage=0.5):
+    """Recall@k, MRR and latency percentiles for one retrieval configuration"""
+    results, latencies = [], []
+    for item in golden:
+        start = time.perf_counter()
+        docs = retrieve_documents(item['question'], vectordb, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(evaluator.evaluate_retrieval([doc.page_content for doc in docs], item['passages'], k,
+                                                   min_coverage))
+
+    summary = evaluator.summarize_retrieval(results)
+    summary.update({
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'missed': [item['id'] for item, r in zip(golden, results) if r['recall'] < 1.0]
+    })
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep chunking and retrieval parameters over a golden set")
+    parser.add_argument("--golden", default=os.path.join(SCRIPT_DIR, "golden_set.jsonl"))
+    parser.add_argument("--docs", default=os.path.join(SCRIPT_DIR, "document"))
+    parser.add_argument("--pattern", default="*.txt")
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[400, CHUNK_SIZE, 1200])
+    parser.add_argument("--chunk-overlaps", type=int, nargs="+", default=[50, CHUNK_OVERLAP])
+    parser.add_argument("--k", type=int, nargs="+", default=[4, RETRIEVAL_K])
+    parser.add_argument("--fetch-k", type=int, nargs="+", default=[RETRIEVAL_FETCH_K, 30])
+    parser.add_argument("--lambda-mult", type=float, nargs="+", default=[0.5, RETRIEVAL_LAMBDA_MULT, 1.0])
+    parser.add_argument("--min-coverage", type=float, default=0.5,
+                        help="Share of a passage's trigrams the retrieved chunks must contain")
+    parser.add_argument("--output", help="Write every configuration's results to this JSON file")
+    args = parser.parse_args()
+
+    golden = load_golden_set(args.golden)
+    paths = sorted(glob.glob(os.path.join(args.docs, "**", args.pattern), recursive=True))
+    if not paths:
+        raise ValueError(f"No files matching '{args.pattern}' found in {args.docs}")
+
+    embeddings = get_embedding_backend()
+    workdir = tempfile.mkdtemp(prefix="rag-sweep-")
+    evaluator = RAGEvaluator(metrics_file=os.path.join(workdir, "metrics", "sweep_metrics.json"))
+    embeddings.embed_query(golden[0]['question'])  # load the model before anything is timed
+
+    print(f"{len(golden)} golden questions over {len(paths)} file(s), {VECTOR_STORE} store, backend {embeddings.name}\n")
+    print(f"{'chunk':>6}{'overlap':>8}{'k':>4}{'fetch_k':>8}{'lambda':>7}{'chunks':>7}{'index KB':>9}"
+          f"{'ingest s':>9}{'recall@k':>9}{'MRR':>6}{'p50 ms':>8}{'p95 ms':>8}")
+
+    results = []
+    try:
+        for chunk_size, chunk_overlap in itertools.product(args.chunk_sizes, args.chunk_overlaps):
+            if chunk_overlap >= chunk_size:
+                continue
+            persist_directory = os.path.join(workdir, f"index_{chunk_size}_{chunk_overlap}")
+            vectordb, index_stats = build_index(paths, args.docs, chunk_size, chunk_overlap,
+                                                persist_directory, embeddings)
+
+            for k, fetch_k, lambda_mult in itertools.product(args.k, args.fetch_k, args.lambda_mult):
+                if fetch_k < k:
+                    continue
+                scores = score_retrieval(vectordb, golden, evaluator, k, fetch_k, lambda_mult, args.min_coverage)
+                result = {'chunk_size': chunk_size, 'chunk_overlap': chunk_overlap, 'k': k, 'fetch_k': fetch_k,
+                          'lambda_mult': lambda_mult, **index_stats, **scores}
+                results.append(result)
+                print(f"{chunk_size:>6}{chunk_overlap:>8}{k:>4}{fetch_k:>8}{lambda_mult:>7.2f}{result['chunks']:>7}"
+                      f"{result['index_bytes'] / 1024:>9.1f}{result['ingest_s']:>9.2f}{result['recall_at_k']:>9.3f}"
+                      f"{result['mrr']:>6.2f}{result['p50_ms']:>8.2f}{result['p95_ms']:>8.2f}")
+
+            clear_index(vectordb, persist_directory)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if results:
+        # Best recall first, then rank quality, then tail latency
+        best = max(results, key=lambda r: (r['recall_at_k'], r['mrr'], -r['p95_ms']))
+        current = next((r for r in results if (r['chunk_size'], r['chunk_overlap'], r['k'], r['fetch_k'], r['lambda_mult'])
+                        == (CHUNK_SIZE, CHUNK_OVERLAP, RETRIEVAL_K, RETRIEVAL_FETCH_K, RETRIEVAL_LAMBDA_MULT)), None)
+        for label, r in (("Best", best), ("Current", current)):
+            if r:
+                print(f"\n{label}: chunk_size={r['chunk_size']} chunk_overlap={r['chunk_overlap']} k={r['k']} "
+                      f"fetch_k={r['fetch_k']} lambda_mult={r['lambda_mult']} -> recall@k {r['recall_at_k']:.3f}, "
+                      f"MRR {r['mrr']:.2f}, p95 {r['p95_ms']:.2f}ms; missed: {', '.join(map(str, r['missed'])) or 'none'}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -1,62 +1,217 @@
 import hashlib
 import json
 import time
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 import numpy as np
-from sentence_transformers import SentenceTransformer
+from embeddings import EmbeddingBackend, get_embedding_backend
+from vector_store import EmbeddingMatrix, STORAGE_DTYPE
 import pickle
 import os
+import threading
+import zlib
+
+# Answers are stored as paragraphs ("segments"), each kept once and shared by every entry citing it
+SEGMENT_SEPARATOR = "\n\n"
+
+# Preset deflate dictionary: the answer template text, so even short segments compress well.
+# Only corpus-independent text belongs here; segments stored under another version cannot be decoded.
+SEGMENT_DICTIONARY = (
+    "**Answer:**\n\n📄 **From: .txt**\n*Also found in: , .txt*\n---\n"
+    "*This answer was compiled from  relevant sections across  document(s) in your collection of  document(s).*\n"
+    " the and of to in is that for with as are by on from"
+).encode()
+# Bump whenever SEGMENT_DICTIONARY changes; caches written before versioning used version 1
+SEGMENT_DICTIONARY_VERSION = 2
 
 class SemanticCache:
-    def __init__(self, cache_dir="./cache", similarity_threshold=0.85, max_cache_size=1000):
+    def __init__(self, cache_dir="./cache", similarity_threshold=0.85, max_cache_size=1000,
+                 embedding_backend: Optional[EmbeddingBackend] = None, embedding_dtype: str = STORAGE_DTYPE):
         self.cache_dir = cache_dir
         self.similarity_threshold = similarity_threshold
         self.max_cache_size = max_cache_size
+        self.embedding_dtype = embedding_dtype
         self.cache_file = os.path.join(cache_dir, "semantic_cache.pkl")
         
-        # Initialize sentence transformer for semantic similarity
-        self.embedding_model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+        # Share the embedding backend with the vector store instead of loading a second model
+        self.embedding_model = embedding_backend or get_embedding_backend()
+        
+        # Guards the entries and matrix; embedding runs outside it so concurrent lookups overlap
+        self._lock = threading.RLock()
+        self._save_lock = threading.Lock()
+        self._version = 0
+        self._saved_version = 0
+        
+        # Compressed answer segments shared between entries, with the number of entries using each
+        self.segments: Dict[bytes, bytes] = {}
+        self.segment_refs: Dict[bytes, int] = {}
         
         # Load existing cache
         self.cache = self._load_cache()
-        self.query_embeddings = self._load_embeddings()
+        self._index_segments()
+        self.query_keys, self.query_matrix = self._load_embeddings()
+        self._index_partitions()
         
         # Ensure cache directory exists
         os.makedirs(cache_dir, exist_ok=True)
     
     def _load_cache(self) -> Dict:
-        """Load cache from disk"""
+        """Load cache entries and answer segments from disk"""
         if os.path.exists(self.cache_file):
             try:
                 with open(self.cache_file, 'rb') as f:
-                    return pickle.load(f)
+                    stored = pickle.load(f)
+                if 'entries' in stored and 'segments' in stored:
+                    entries, self.segments = self._current_segments(
+                        stored['entries'], stored['segments'], stored.get('dictionary_version', 1))
+                    return entries
+                # Files written before segment storage hold the entries dict directly
+                return stored
             except:
                 return {}
         return {}
     
-    def _load_embeddings(self) -> Dict:
-        """Load query embeddings from disk"""
+    @staticmethod
+    def _current_segments(entries: Dict, segments: Dict, version: int) -> Tuple[Dict, Dict]:
+        """Drop entries whose segments were compressed with another dictionary version, as (entries, segments)"""
+        if version == SEGMENT_DICTIONARY_VERSION or not segments:
+            return entries, segments
+        kept = {key: entry for key, entry in entries.items() if 'response_segments' not in entry['result']}
+        print(f"⚠️ Dropped {len(entries) - len(kept)} cache entries compressed with segment dictionary v{version}")
+        return kept, {}
+    
+    @staticmethod
+    def _compress(segment: str) -> bytes:
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -15, zdict=SEGMENT_DICTIONARY)
+        return compressor.compress(segment.encode()) + compressor.flush()
+    
+    @staticmethod
+    def _decompress(data: bytes) -> str:
+        return zlib.decompressobj(-15, zdict=SEGMENT_DICTIONARY).decompress(data).decode()
+    
+    def _pack(self, result: Dict) -> Dict:
+        """Replace a result's response text with references to shared compressed segments"""
+        packed = dict(result)
+        response = packed.pop('response', None)
+        if response is None:
+            return packed
+        keys = []
+        for segment in response.split(SEGMENT_SEPARATOR):
+            key = hashlib.blake2b(segment.encode(), digest_size=12).digest()
+            if key not in self.segments:
+                self.segments[key] = self._compress(segment)
+            self.segment_refs[key] = self.segment_refs.get(key, 0) + 1
+            keys.append(key)
+        packed['response_segments'] = keys
+        packed['response_length'] = len(response)
+        return packed
+    
+    def _unpack(self, entry: Dict) -> Dict:
+        """Copy of an entry with its response reassembled from segments"""
+        result = dict(entry['result'])
+        keys = result.pop('response_segments', None)
+        if keys is not None:
+            result['response'] = SEGMENT_SEPARATOR.join(self._decompress(self.segments[key]) for key in keys)
+            result.pop('response_length', None)
+        return {**entry, 'result': result}
+    
+    def _release(self, result: Dict):
+        """Drop an entry's references, deleting segments no other entry uses"""
+        for key in result.get('response_segments', []):
+            self.segment_refs[key] -= 1
+            if self.segment_refs[key] <= 0:
+                del self.segment_refs[key]
+                self.segments.pop(key, None)
+    
+    def _index_segments(self):
+        """Rebuild reference counts from the entries, packing any entry that still holds plain text"""
+        self.segment_refs = {}
+        for entry in self.cache.values():
+            if 'response' in entry['result']:
+                entry['result'] = self._pack(entry['result'])
+            else:
+                for key in entry['result'].get('response_segments', []):
+                    self.segment_refs[key] = self.segment_refs.get(key, 0) + 1
+        # Segments left over from entries that no longer exist
+        self.segments = {key: self.segments[key] for key in self.segment_refs}
+    
+    def _index_partitions(self):
+        """Rebuild the per-row partition ids and per-partition counts from the entries, in query_keys order"""
+        self.partition_ids: Dict[str, int] = {"": 0}
+        self.partition_counts: Dict[str, int] = {}
+        self.row_partitions = np.zeros(max(16, len(self.query_keys)), dtype=np.int32)
+        for row, key in enumerate(self.query_keys):
+            self._set_row_partition(row, self.cache[key].get('partition', ""))
+    
+    def _set_row_partition(self, row: int, partition: str):
+        """Record the partition of a newly appended query matrix row"""
+        if row >= len(self.row_partitions):
+            # Grow geometrically, like the query matrix itself
+            grown = np.zeros(2 * len(self.row_partitions), dtype=np.int32)
+            grown[:len(self.row_partitions)] = self.row_partitions
+            self.row_partitions = grown
+        self.row_partitions[row] = self.partition_ids.setdefault(partition, len(self.partition_ids))
+        self.partition_counts[partition] = self.partition_counts.get(partition, 0) + 1
+    
+    def _load_embeddings(self):
+        """Load query embeddings from disk as (keys, matrix), re-embedding if the stored format is stale"""
         embeddings_file = os.path.join(self.cache_dir, "query_embeddings.pkl")
         if os.path.exists(embeddings_file):
             try:
                 with open(embeddings_file, 'rb') as f:
-                    return pickle.load(f)
+                    stored = pickle.load(f)
+                matrix = stored['matrix']
+                # Backends can share a dimension, so the name is what proves the vectors are comparable
+                if (stored.get('embedding_backend') == self.embedding_model.name
+                        and stored['keys'] == list(self.cache) and matrix.dtype == self.embedding_dtype
+                        and matrix.dimension == self.embedding_model.dimension):
+                    return stored['keys'], matrix
             except:
-                return {}
-        return {}
+                pass
+        return self._rebuild_embeddings()
+    
+    def _rebuild_embeddings(self):
+        """Re-embed every cached query, e.g. after a backend, dtype or file format change"""
+        keys = list(self.cache)
+        matrix = EmbeddingMatrix(dtype=self.embedding_dtype)
+        if keys:
+            matrix.add(self.embedding_model.encode([self.cache[key]['query'] for key in keys]))
+        return keys, matrix
     
     def _save_cache(self):
-        """Save cache to disk"""
-        with open(self.cache_file, 'wb') as f:
-            pickle.dump(self.cache, f)
+        """Save cache to disk from a snapshot, so lookups are not blocked while pickling"""
+        with self._lock:
+            self._version += 1
+            version = self._version
+            cache = {'entries': dict(self.cache), 'segments': dict(self.segments),
+                     'dictionary_version': SEGMENT_DICTIONARY_VERSION}
+            embeddings = {'keys': list(self.query_keys), 'matrix': self.query_matrix.copy(),
+                          'embedding_backend': self.embedding_model.name}
         
-        embeddings_file = os.path.join(self.cache_dir, "query_embeddings.pkl")
-        with open(embeddings_file, 'wb') as f:
-            pickle.dump(self.query_embeddings, f)
+        with self._save_lock:
+            # A concurrent save may already have written a newer snapshot
+            if version < self._saved_version:
+                return
+            with open(self.cache_file, 'wb') as f:
+                pickle.dump(cache, f)
+            
+            embeddings_file = os.path.join(self.cache_dir, "query_embeddings.pkl")
+            with open(embeddings_file, 'wb') as f:
+                pickle.dump(embeddings, f)
+            self._saved_version = version
     
-    def _get_query_hash(self, query: str) -> str:
-        """Generate hash for query"""
-        return hashlib.md5(query.encode()).hexdigest()
+    def _get_query_hash(self, query: str, partition: str = "") -> str:
+        """Generate hash for query, scoped to its partition"""
+        key = f"{partition}\n{query}" if partition else query
+        return hashlib.md5(key.encode()).hexdigest()
+    
+    def _partition_mask(self, partition: str) -> Optional[np.ndarray]:
+        """Rows of the query matrix in a partition, or None when every entry is in it"""
+        count = self.partition_counts.get(partition, 0)
+        if count == len(self.query_keys):
+            return None
+        if count == 0:
+            return np.zeros(len(self.query_keys), dtype=bool)
+        return self.row_partitions[:len(self.query_keys)] == self.partition_ids[partition]
     
     def _compute_similarity(self, query1: str, query2: str) -> float:
         """Compute semantic similarity between two queries"""
@@ -66,51 +221,102 @@ class SemanticCache:
         )
         return similarity
     
-    def get(self, query: str) -> Optional[Dict]:
-        """Get cached result for similar query"""
-        query_hash = self._get_query_hash(query)
+    def get(self, query: str, partition: str = "") -> Optional[Dict]:
+        """Get cached result for similar query asked against the same partition (collection and document filter)"""
+        query_hash = self._get_query_hash(query, partition)
         
         # Check exact match first
-        if query_hash in self.cache:
-            return self.cache[query_hash]
+        with self._lock:
+            if query_hash in self.cache:
+                return self._unpack(self.cache[query_hash])
         
-        # Check semantic similarity
+        # Check semantic similarity against every cached query in one matrix product
         query_embedding = self.embedding_model.encode([query])[0]
-        
-        for cached_query_hash, cached_embedding in self.query_embeddings.items():
-            similarity = np.dot(query_embedding, cached_embedding) / (
-                np.linalg.norm(query_embedding) * np.linalg.norm(cached_embedding)
-            )
+        with self._lock:
+            rows, scores = self.query_matrix.search(query_embedding, 1, self._partition_mask(partition))
             
-            if similarity >= self.similarity_threshold:
-                print(f"🎯 Semantic cache hit! Similarity: {similarity:.3f}")
-                return self.cache[cached_query_hash]
+            if len(rows) and scores[0] >= self.similarity_threshold:
+                print(f"🎯 Semantic cache hit! Similarity: {scores[0]:.3f}")
+                return self._unpack(self.cache[self.query_keys[rows[0]]])
         
         return None
     
-    def set(self, query: str, result: Dict):
+    def set(self, query: str, result: Dict, partition: str = ""):
         """Cache query and result"""
-        query_hash = self._get_query_hash(query)
-        
-        # Add to cache
-        self.cache[query_hash] = {
-            'result': result,
-            'timestamp': time.time(),
-            'query': query
-        }
+        query_hash = self._get_query_hash(query, partition)
         
-        # Add embedding
         query_embedding = self.embedding_model.encode([query])[0]
-        self.query_embeddings[query_hash] = query_embedding
         
-        # Manage cache size
-        if len(self.cache) > self.max_cache_size:
-            self._evict_oldest()
+        with self._lock:
+            # Replace an existing entry for the same query
+            if query_hash in self.cache:
+                self._remove([query_hash])
+            
+            # Add to cache
+            self.cache[query_hash] = {
+                'result': self._pack(result),
+                'timestamp': time.time(),
+                'query': query,
+                'partition': partition
+            }
+            
+            # Add embedding
+            self.query_matrix.add(query_embedding)
+            self._set_row_partition(len(self.query_keys), partition)
+            self.query_keys.append(query_hash)
+            
+            # Manage cache size
+            if len(self.cache) > self.max_cache_size:
+                self._evict_oldest()
         
         # Save to disk
         self._save_cache()
         print(f"💾 Cached query: {query[:50]}...")
     
+    def missing(self, queries: List[str], partition: str = "") -> List[str]:
+        """Queries that would miss the cache, checked with one batched embedding call"""
+        with self._lock:
+            candidates = [query for query in queries if self._get_query_hash(query, partition) not in self.cache]
+        if not candidates:
+            return []
+        
+        query_embeddings = self.embedding_model.encode(candidates)
+        missing = []
+        with self._lock:
+            mask = self._partition_mask(partition)
+            for query, query_embedding in zip(candidates, query_embeddings):
+                rows, scores = self.query_matrix.search(query_embedding, 1, mask)
+                if not len(rows) or scores[0] < self.similarity_threshold:
+                    missing.append(query)
+        return missing
+    
+    def set_many(self, entries: List[Tuple[str, Dict]], partition: str = ""):
+        """Cache several (query, result) pairs with one embedding call and one save"""
+        if not entries:
+            return
+        query_embeddings = self.embedding_model.encode([query for query, _ in entries])
+        
+        with self._lock:
+            for (query, result), query_embedding in zip(entries, query_embeddings):
+                query_hash = self._get_query_hash(query, partition)
+                if query_hash in self.cache:
+                    self._remove([query_hash])
+                self.cache[query_hash] = {
+                    'result': self._pack(result),
+                    'timestamp': time.time(),
+                    'query': query,
+                    'partition': partition
+                }
+                self.query_matrix.add(query_embedding)
+                self._set_row_partition(len(self.query_keys), partition)
+                self.query_keys.append(query_hash)
+            
+            if len(self.cache) > self.max_cache_size:
+                self._evict_oldest()
+        
+        self._save_cache()
+        print(f"💾 Cached {len(entries)} queries")
+    
     def _evict_oldest(self):
         """Remove oldest cache entries"""
         sorted_items = sorted(
@@ -120,23 +326,83 @@ class SemanticCache:
         
         # Remove oldest 20% of entries
         to_remove = len(sorted_items) // 5
-        for i in range(to_remove):
-            query_hash = sorted_items[i][0]
-            del self.cache[query_hash]
-            if query_hash in self.query_embeddings:
-                del self.query_embeddings[query_hash]
+        self._remove([query_hash for query_hash, _ in sorted_items[:to_remove]])
+    
+    def _remove(self, query_hashes: List[str]):
+        """Remove entries and their embedding rows"""
+        targets = set(query_hashes)
+        rows = [i for i, key in enumerate(self.query_keys) if key in targets]
+        self.query_matrix.remove(rows)
+        keep = np.ones(len(self.query_keys), dtype=bool)
+        keep[rows] = False
+        self.row_partitions[:int(keep.sum())] = self.row_partitions[:len(keep)][keep]
+        self.query_keys = [key for key in self.query_keys if key not in targets]
+        for query_hash in targets:
+            entry = self.cache.pop(query_hash, None)
+            if entry is not None:
+                self._release(entry['result'])
+                partition = entry.get('partition', "")
+                self.partition_counts[partition] -= 1
+                if not self.partition_counts[partition]:
+                    del self.partition_counts[partition]
     
     def clear(self):
         """Clear all cache"""
-        self.cache = {}
-        self.query_embeddings = {}
+        with self._lock:
+            self.cache = {}
+            self.segments = {}
+            self.segment_refs = {}
+            self.query_keys = []
+            self.query_matrix.clear()
+            self._index_partitions()
         self._save_cache()
         print("🗑️ Cache cleared")
     
+    def export_state(self) -> Dict:
+        """Snapshot of entries and query embeddings for bundling with an index snapshot"""
+        with self._lock:
+            return {
+                'cache': dict(self.cache),
+                'segments': dict(self.segments),
+                'dictionary_version': SEGMENT_DICTIONARY_VERSION,
+                'keys': list(self.query_keys),
+                'matrix': self.query_matrix.copy(),
+                'embedding_backend': self.embedding_model.name
+            }
+    
+    def import_state(self, state: Dict):
+        """Replace the cache with an exported state, re-embedding queries only if the backend or dtype differ"""
+        with self._lock:
+            # States exported before segment storage carry plain-text responses, which are packed here
+            self.cache, self.segments = self._current_segments(
+                dict(state['cache']), dict(state.get('segments', {})), state.get('dictionary_version', 1))
+            self._index_segments()
+            matrix = state['matrix']
+            if (state.get('embedding_backend') == self.embedding_model.name and matrix.dtype == self.embedding_dtype
+                    and state['keys'] == list(self.cache)):
+                self.query_keys, self.query_matrix = list(state['keys']), matrix.copy()
+            else:
+                self.query_keys, self.query_matrix = self._rebuild_embeddings()
+            self._index_partitions()
+        self._save_cache()
+        print(f"📥 Imported {len(self.cache)} cache entries")
+    
     def get_stats(self) -> Dict:
         """Get cache statistics"""
+        with self._lock:
+            response_bytes = sum(entry['result'].get('response_length', 0) for entry in self.cache.values())
+            segment_bytes = sum(len(data) for data in self.segments.values())
+            segment_count = len(self.segments)
         return {
             'cache_size': len(self.cache),
             'max_size': self.max_cache_size,
-            'similarity_threshold': self.similarity_threshold
+            'similarity_threshold': self.similarity_threshold,
+            'embedding_backend': self.embedding_model.name,
+            'embedding_dtype': self.embedding_dtype,
+            'embedding_bytes': self.query_matrix.nbytes,
+            'partitions': len(self.partition_counts),
+            'answer_segments': segment_count,
+            'answer_bytes': response_bytes,
+            'answer_stored_bytes': segment_bytes,
+            'answer_compression_ratio': response_bytes / segment_bytes if segment_bytes else 0.0
         } 
\ No newline at end of file
@@ -0,0 +1,284 @@
+import multiprocessing as mp
+import os
+import pickle
+import threading
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterable, List, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from vector_store import EmbeddingMatrix, MetadataIndex, STORAGE_DTYPE
+
+# Number of worker processes used by the "sharded" vector store
+NUM_SHARDS = int(os.environ.get("RAG_NUM_SHARDS", os.cpu_count() or 2))
+
+# "hash" spreads chunks evenly; "document" keeps each document's chunks on one shard
+SHARD_BY = os.environ.get("RAG_SHARD_BY", "hash")
+
+class _Shard:
+    """Chunks and vectors owned by one worker process"""
+
+    def __init__(self, dtype: str):
+        self.matrix = EmbeddingMatrix(dtype=dtype)
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadatas: List[dict] = []
+        self.metadata_index = MetadataIndex()
+
+    def add(self, texts, vectors, metadatas, ids):
+        self.matrix.add(vectors)
+        self.ids.extend(ids)
+        self.texts.extend(texts)
+        self.metadatas.extend(metadatas)
+        self.metadata_index.clear()
+        return len(self.ids)
+
+    def search(self, query, k, where=None):
+        """Top-k candidates as (score, id, text, metadata, vector) tuples for central merging"""
+        mask = self.metadata_index.mask(self.metadatas, where) if where else None
+        rows, scores = self.matrix.search(query, k, mask)
+        vectors = self.matrix.get(rows) if len(rows) else []
+        return [(float(score), self.ids[row], self.texts[row], self.metadatas[row], vectors[i])
+                for i, (row, score) in enumerate(zip(rows, scores))]
+
+    def delete(self, ids):
+        targets = set(ids)
+        rows = [i for i, chunk_id in enumerate(self.ids) if chunk_id in targets]
+        self.matrix.remove(rows)
+        for i in reversed(rows):
+            del self.ids[i], self.texts[i], self.metadatas[i]
+        self.metadata_index.clear()
+        return len(rows)
+
+    def export(self):
+        return {'matrix': self.matrix, 'ids': self.ids, 'texts': self.texts, 'metadatas': self.metadatas}
+
+    def load(self, state):
+        self.matrix = state['matrix']
+        self.ids, self.texts, self.metadatas = state['ids'], state['texts'], state['metadatas']
+        self.metadata_index.clear()
+
+    def stats(self):
+        return {'chunks': len(self.ids), 'vector_bytes': self.matrix.nbytes}
+
+def _shard_worker(conn, dtype: str):
+    """Serve requests for one shard until told to stop"""
+    shard = _Shard(dtype)
+    while True:
+        try:
+            op, args = conn.recv()
+        except EOFError:
+            break
+        if op == "stop":
+            break
+        try:
+            conn.send(("ok", getattr(shard, op)(*args)))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+    conn.close()
+
+def _mp_context():
+    # fork keeps workers from re-importing the caller's __main__ (app.py loads models at import time)
+    if "fork" in mp.get_all_start_methods():
+        return mp.get_context("fork")
+    return mp.get_context("spawn")
+
+class ShardedVectorStore(VectorStore):
+    """Vector store split across worker processes, searched with parallel scatter-gather.
+
+    Chunks are routed to a shard by source document or by chunk id hash. Each query is
+    embedded once here, sent to every shard concurrently, and the per-shard top
+    candidates are merged centrally (top-k or MMR). Each shard has its own lock, so
+    an insert into one shard only delays requests to that shard.
+    """
+
+    def __init__(self, embedding: Embeddings, num_shards: int = NUM_SHARDS, dtype: str = STORAGE_DTYPE,
+                 shard_by: str = SHARD_BY):
+        if shard_by not in ("document", "hash"):
+            raise ValueError("shard_by must be 'document' or 'hash'")
+        self._embedding = embedding
+        self.num_shards = max(1, num_shards)
+        self.dtype = dtype
+        self.shard_by = shard_by
+
+        context = _mp_context()
+        self._connections = []
+        self._processes = []
+        for _ in range(self.num_shards):
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(target=_shard_worker, args=(child_conn, dtype), daemon=True)
+            process.start()
+            child_conn.close()
+            self._connections.append(parent_conn)
+            self._processes.append(process)
+        self._locks = [threading.Lock() for _ in range(self.num_shards)]
+        self._pool = ThreadPoolExecutor(max_workers=self.num_shards)
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def _call(self, shard: int, op: str, *args):
+        """Run one operation on a shard and return its result"""
+        with self._locks[shard]:
+            self._connections[shard].send((op, args))
+            status, result = self._connections[shard].recv()
+        if status == "error":
+            raise RuntimeError(f"Shard {shard} failed on {op}: {result}")
+        return result
+
+    def _broadcast(self, op: str, *args) -> list:
+        """Run the same operation on every shard in parallel"""
+        futures = [self._pool.submit(self._call, shard, op, *args) for shard in range(self.num_shards)]
+        return [future.result() for future in futures]
+
+    def _shard_for(self, chunk_id: str, metadata: dict) -> int:
+        key = metadata.get('source', chunk_id) if self.shard_by == "document" else chunk_id
+        return zlib.crc32(str(key).encode()) % self.num_shards
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        """Embed texts here and route them to their shards"""
+        texts = list(texts)
+        if not texts:
+            return []
+        return self.add_embeddings(texts, self._embedding.embed_documents(texts), metadatas=metadatas, ids=ids)
+
+    def add_embeddings(self, texts: List[str], embeddings, metadatas: Optional[List[dict]] = None,
+                       ids: Optional[List[str]] = None) -> List[str]:
+        """Add texts with precomputed embeddings, writing to the shards in parallel"""
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        metadatas = [dict(m) for m in metadatas] if metadatas else [{} for _ in texts]
+        vectors = np.asarray(embeddings, dtype=np.float32)
+
+        routed = [[] for _ in range(self.num_shards)]
+        for i, (chunk_id, metadata) in enumerate(zip(ids, metadatas)):
+            routed[self._shard_for(chunk_id, metadata)].append(i)
+
+        futures = [
+            self._pool.submit(self._call, shard, "add", [texts[i] for i in rows], vectors[rows],
+                              [metadatas[i] for i in rows], [ids[i] for i in rows])
+            for shard, rows in enumerate(routed) if rows
+        ]
+        for future in futures:
+            future.result()
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if not ids:
+            return False
+        self._broadcast("delete", list(ids))
+        return True
+
+    def _gather(self, query: np.ndarray, k: int, where: Optional[dict] = None):
+        """Scatter a query (and its metadata filter) to all shards and merge their candidates by score"""
+        candidates = [c for shard_candidates in self._broadcast("search", query, k, where) for c in shard_candidates]
+        candidates.sort(key=lambda c: c[0], reverse=True)
+        return candidates[:k]
+
+    @staticmethod
+    def _document(candidate) -> Document:
+        return Document(page_content=candidate[2], metadata=dict(candidate[3]))
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                               filter: Optional[dict] = None,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        candidates = self._gather(np.asarray(embedding, dtype=np.float32), k, filter)
+        return [(self._document(c), c[0]) for c in candidates]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self._embedding.embed_query(query), k, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def _similarity_search_with_relevance_scores(self, query: str, k: int = 4,
+                                                 **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score(query, k, **kwargs)
+
+    def max_marginal_relevance_search_by_vector(self, embedding: List[float], k: int = 4, fetch_k: int = 20,
+                                                lambda_mult: float = 0.5, filter: Optional[dict] = None,
+                                                **kwargs: Any) -> List[Document]:
+        query = np.asarray(embedding, dtype=np.float32)
+        # Each shard returns its own top fetch_k; the global fetch_k are the best of those
+        candidates = self._gather(query, fetch_k, filter)
+        if not candidates:
+            return []
+        selected = maximal_marginal_relevance(query, [c[4] for c in candidates], k=k, lambda_mult=lambda_mult)
+        return [self._document(candidates[i]) for i in selected]
+
+    def max_marginal_relevance_search(self, query: str, k: int = 4, fetch_k: int = 20,
+                                      lambda_mult: float = 0.5, **kwargs: Any) -> List[Document]:
+        return self.max_marginal_relevance_search_by_vector(
+            self._embedding.embed_query(query), k, fetch_k, lambda_mult, **kwargs
+        )
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   ids: Optional[List[str]] = None, num_shards: int = NUM_SHARDS, dtype: str = STORAGE_DTYPE,
+                   shard_by: str = SHARD_BY, **kwargs: Any) -> "ShardedVectorStore":
+        store = cls(embedding, num_shards=num_shards, dtype=dtype, shard_by=shard_by)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+    def export_chunks(self):
+        """All chunks as (ids, texts, metadatas, matrix), concatenated across shards"""
+        states = self._broadcast("export")
+        ids = [chunk_id for state in states for chunk_id in state['ids']]
+        texts = [text for state in states for text in state['texts']]
+        metadatas = [metadata for state in states for metadata in state['metadatas']]
+        matrix = EmbeddingMatrix.from_codes(
+            np.concatenate([state['matrix'].codes for state in states if len(state['matrix'])] or
+                           [np.zeros((0, self._embedding.dimension), dtype=np.dtype(self.dtype))]),
+            np.concatenate([state['matrix'].scales for state in states if len(state['matrix'])] or
+                           [np.zeros(0, dtype=np.float32)]),
+            self.dtype
+        )
+        return ids, texts, metadatas, matrix
+
+    def save(self, path: str):
+        """Persist every shard's state to a single file"""
+        with open(path, 'wb') as f:
+            pickle.dump({'num_shards': self.num_shards, 'dtype': self.dtype, 'shard_by': self.shard_by,
+                         'shards': self._broadcast("export")}, f)
+
+    @classmethod
+    def load(cls, path: str, embedding: Embeddings) -> "ShardedVectorStore":
+        """Start workers and hand each its saved shard, without re-embedding anything"""
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+        store = cls(embedding, num_shards=state['num_shards'], dtype=state['dtype'], shard_by=state['shard_by'])
+        futures = [store._pool.submit(store._call, shard, "load", shard_state)
+                   for shard, shard_state in enumerate(state['shards'])]
+        for future in futures:
+            future.result()
+        return store
+
+    def close(self):
+        """Stop the worker processes"""
+        for shard, conn in enumerate(self._connections):
+            with self._locks[shard]:
+                try:
+                    conn.send(("stop", ()))
+                except (BrokenPipeError, OSError):
+                    pass
+        for process in self._processes:
+            process.join(timeout=5)
+        self._pool.shutdown(wait=False)
+
+    def get_stats(self):
+        """Chunk count and vector memory per shard"""
+        shards = self._broadcast("stats")
+        return {
+            'chunks': sum(s['chunks'] for s in shards),
+            'dtype': self.dtype,
+            'vector_bytes': sum(s['vector_bytes'] for s in shards),
+            'shards': shards
+        }
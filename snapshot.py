@@ -0,0 +1,222 @@
+"""Index snapshots: export the document index as one versioned bundle and load it with no model inference.
+
+A bundle is a directory:
+    manifest.json     format version, embedding backend, storage dtype, counts and document list
+    embeddings.npy    chunk vectors in their storage dtype (memory-mapped on import)
+    scales.npy        per-row scales for int8 vectors
+    chunks.jsonl      one {"id", "text", "metadata"} object per chunk, in embeddings.npy row order
+    dedup.pkl         near-duplicate groups (optional)
+    cache.pkl         SemanticCache entries and query embeddings (optional)
+"""
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import time
+import uuid
+from typing import Dict
+import numpy as np
+from embeddings import get_embedding_backend
+from main import VECTOR_STORE, PERSIST_DIRECTORY, IMPORTED_STORE_PREFIX, open_chroma, close_vectordb
+from sharding import ShardedVectorStore, NUM_SHARDS
+from vector_store import CompactVectorStore, EmbeddingMatrix, add_precomputed_embeddings
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+# Bundles named in admin requests are resolved inside this directory, never anywhere else on disk
+SNAPSHOT_DIR = os.environ.get("RAG_SNAPSHOT_DIR", "./snapshots")
+
+def resolve_snapshot_path(name: str, root: str = SNAPSHOT_DIR) -> str:
+    """Map a bundle name from a request to a path inside the snapshot root, rejecting anything that escapes it"""
+    name = (name or "").strip()
+    if not name:
+        raise ValueError("Please provide a snapshot name")
+    if os.path.isabs(name) or ".." in name.replace("\\", "/").split("/"):
+        raise ValueError("Snapshot names must be relative to the snapshot directory and may not contain '..'")
+    root = os.path.realpath(root)
+    path = os.path.realpath(os.path.join(root, name))
+    if path == root or os.path.commonpath([root, path]) != root:
+        raise ValueError("Snapshot names must point inside the snapshot directory")
+    return path
+
+def is_snapshot(path: str) -> bool:
+    """Whether a directory holds a snapshot bundle (and so may be replaced by an export)"""
+    return os.path.isfile(os.path.join(path, "manifest.json"))
+
+def _collect_chunks(vectordb):
+    """Return (ids, texts, metadatas, matrix) for any store type without re-embedding"""
+    if hasattr(vectordb, 'export_chunks'):
+        return vectordb.export_chunks()
+
+    # Chroma keeps float32 vectors; read them straight from the collection
+    data = vectordb._collection.get(include=["embeddings", "documents", "metadatas"])
+    matrix = EmbeddingMatrix(dtype="float32")
+    if data['ids']:
+        matrix.add(np.asarray(data['embeddings'], dtype=np.float32))
+    return data['ids'], data['documents'], data['metadatas'], matrix
+
+def export_snapshot(path: str, vectordb, documents, deduplicator=None, semantic_cache=None) -> Dict:
+    """Write the index (and optionally dedup state and semantic cache) as a snapshot bundle at path"""
+    if vectordb is None:
+        raise ValueError("No index to snapshot. Upload or index documents first.")
+
+    # Only ever replace an earlier bundle, never an unrelated directory that happens to be at path
+    if os.path.exists(path) and not is_snapshot(path):
+        raise ValueError(f"{path} exists and is not a snapshot bundle; refusing to overwrite it")
+
+    start = time.perf_counter()
+    ids, texts, metadatas, matrix = _collect_chunks(vectordb)
+
+    # Build in a fresh directory next to the target and swap in at the end, so readers never see a half-written bundle
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=f".{os.path.basename(os.path.abspath(path))}.partial-", dir=parent)
+
+    # An empty store has not allocated its matrix yet; write a 0-row array of the backend's dimension
+    dimension = matrix.dimension or vectordb.embeddings.dimension
+    codes = matrix.codes if len(matrix) else np.zeros((0, dimension), dtype=np.dtype(matrix.dtype))
+    np.save(os.path.join(staging, "embeddings.npy"), codes)
+    if matrix.dtype == "int8":
+        np.save(os.path.join(staging, "scales.npy"), matrix.scales if len(matrix) else np.zeros(0, dtype=np.float32))
+
+    with open(os.path.join(staging, "chunks.jsonl"), 'w') as f:
+        for chunk_id, text, metadata in zip(ids, texts, metadatas):
+            f.write(json.dumps({'id': chunk_id, 'text': text, 'metadata': metadata}) + "\n")
+
+    if deduplicator is not None:
+        with open(os.path.join(staging, "dedup.pkl"), 'wb') as f:
+            pickle.dump(deduplicator, f)
+
+    if semantic_cache is not None:
+        with open(os.path.join(staging, "cache.pkl"), 'wb') as f:
+            pickle.dump(semantic_cache.export_state(), f)
+
+    manifest = {
+        'version': SNAPSHOT_FORMAT_VERSION,
+        'created_at': time.time(),
+        'embedding_backend': vectordb.embeddings.name,
+        'storage_dtype': matrix.dtype,
+        'dimension': dimension,
+        'chunks': len(ids),
+        'documents': documents,
+        'includes_dedup': deduplicator is not None,
+        'includes_cache': semantic_cache is not None
+    }
+    with open(os.path.join(staging, "manifest.json"), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    if os.path.exists(path):
+        if not is_snapshot(path):
+            shutil.rmtree(staging)
+            raise ValueError(f"{path} exists and is not a snapshot bundle; refusing to overwrite it")
+        shutil.rmtree(path)
+    os.rename(staging, path)
+
+    size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    stats = {'path': path, 'chunks': len(ids), 'bytes': size, 'time_s': time.perf_counter() - start}
+    print(f"📦 Exported snapshot with {len(ids)} chunks ({size / 1e6:.1f} MB) to {path} in {stats['time_s']:.2f}s")
+    return stats
+
+def read_manifest(path: str) -> Dict:
+    """Read and version-check a bundle's manifest"""
+    with open(os.path.join(path, "manifest.json")) as f:
+        manifest = json.load(f)
+    if manifest.get('version') != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format version {manifest.get('version')} in {path}")
+    return manifest
+
+def link_snapshot(path: str, persist_directory: str = PERSIST_DIRECTORY) -> str:
+    """Hard-link (or copy) a bundle's store files into a new directory under persist_directory.
+
+    The index then maps its own files, so exporting over the bundle later cannot break a restart.
+    """
+    os.makedirs(persist_directory, exist_ok=True)
+    target = tempfile.mkdtemp(prefix=IMPORTED_STORE_PREFIX, dir=persist_directory)
+    for name in ("manifest.json", "embeddings.npy", "scales.npy", "chunks.jsonl"):
+        source = os.path.join(path, name)
+        if not os.path.exists(source):
+            continue
+        try:
+            os.link(source, os.path.join(target, name))
+        except OSError:
+            # Different filesystem or no hard-link support
+            shutil.copy2(source, os.path.join(target, name))
+    return target
+
+def open_snapshot(path: str, manifest: Dict, vector_store: str = VECTOR_STORE,
+                  persist_directory: str = PERSIST_DIRECTORY):
+    """Build a new vector store holding a bundle's chunks, leaving every other store untouched"""
+    # Copy-on-write mapping: pages are read lazily from disk and later inserts never touch the file
+    codes = np.load(os.path.join(path, "embeddings.npy"), mmap_mode='c')
+    dtype = manifest['storage_dtype']
+    if not len(codes):
+        matrix = EmbeddingMatrix(dtype=dtype)
+    else:
+        if dtype == "int8":
+            scales = np.load(os.path.join(path, "scales.npy"), mmap_mode='c')
+        else:
+            scales = np.ones(len(codes), dtype=np.float32)
+        matrix = EmbeddingMatrix.from_codes(codes, scales, dtype)
+
+    ids, texts, metadatas = [], [], []
+    with open(os.path.join(path, "chunks.jsonl")) as f:
+        for line in f:
+            chunk = json.loads(line)
+            ids.append(chunk['id'])
+            texts.append(chunk['text'])
+            metadatas.append(chunk['metadata'])
+    if len(ids) != len(matrix):
+        raise ValueError(f"Snapshot {path} is inconsistent: {len(ids)} chunks but {len(matrix)} vectors")
+
+    # The backend is only needed to embed future queries; no chunk is re-embedded here
+    embeddings = get_embedding_backend(manifest['embedding_backend'])
+    if vector_store == "compact":
+        vectordb = CompactVectorStore(embeddings, dtype=dtype)
+        vectordb.matrix = matrix
+        vectordb.ids, vectordb.texts, vectordb.metadatas = ids, texts, metadatas
+        return vectordb
+
+    # Sharded and Chroma stores route the precomputed vectors into their own storage; Chroma gets
+    # a collection of its own so the one still being served is not touched
+    if vector_store == "sharded":
+        vectordb = ShardedVectorStore(embeddings, num_shards=NUM_SHARDS, dtype=dtype)
+    else:
+        vectordb = open_chroma(persist_directory, embeddings, f"snapshot_{uuid.uuid4().hex[:12]}")
+    try:
+        if ids:
+            add_precomputed_embeddings(vectordb, texts, matrix.get(np.arange(len(matrix))), metadatas, ids)
+    except Exception:
+        close_vectordb(vectordb)
+        raise
+    return vectordb
+
+def import_snapshot(path: str, semantic_cache=None, persist_directory: str = PERSIST_DIRECTORY):
+    """Load a snapshot bundle into a new store as (vectordb, documents, deduplicator, stats).
+
+    The current store is not modified; the caller swaps the result in and then closes the old one.
+    """
+    start = time.perf_counter()
+    manifest = read_manifest(path)
+    # Chroma copies the vectors into its own collection; the in-memory stores map local links to the files
+    local = None if VECTOR_STORE == "chroma" else link_snapshot(path, persist_directory)
+    try:
+        vectordb = open_snapshot(local or path, manifest, VECTOR_STORE, persist_directory)
+    except Exception:
+        if local:
+            shutil.rmtree(local, ignore_errors=True)
+        raise
+
+    deduplicator = None
+    if manifest.get('includes_dedup'):
+        with open(os.path.join(path, "dedup.pkl"), 'rb') as f:
+            deduplicator = pickle.load(f)
+
+    if semantic_cache is not None and manifest.get('includes_cache'):
+        with open(os.path.join(path, "cache.pkl"), 'rb') as f:
+            semantic_cache.import_state(pickle.load(f))
+
+    stats = {'path': path, 'directory': local, 'created_at': manifest['created_at'], 'chunks': manifest['chunks'],
+             'documents': len(manifest['documents']), 'time_s': time.perf_counter() - start}
+    print(f"📥 Imported snapshot with {manifest['chunks']} chunks from {path} in {stats['time_s']:.2f}s")
+    return vectordb, manifest['documents'], deduplicator, stats
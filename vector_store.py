@@ -0,0 +1,445 @@
+import os
+import pickle
+import threading
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+
+# Storage precision for cached query vectors and compact chunk vectors ("float32", "float16" or "int8")
+STORAGE_DTYPE = os.environ.get("RAG_STORAGE_DTYPE", "float32")
+
+SUPPORTED_DTYPES = ("float32", "float16", "int8")
+
+# Rows scored per block; float16/int8 blocks are widened into a float32 buffer of this many rows,
+# small enough to stay in cache between the conversion and the matrix-vector product
+SEARCH_BLOCK_ROWS = 2048
+
+class EmbeddingMatrix:
+    """Growable matrix of unit-normalized vectors stored as float32, float16 or int8.
+
+    int8 rows are scalar-quantized with a per-row scale (max |x| / 127). Search
+    computes the raw dot product of the stored codes with the quantized query and
+    applies both scales to the scores only, so stored rows are never dequantized.
+
+    float32 rows go straight to BLAS. float16 and int8 rows are widened block by
+    block first; numpy's float16 conversion is slow, so float16 halves memory at a
+    several-fold search latency cost, while int8 saves more memory and stays close
+    to float32 speed.
+    """
+
+    def __init__(self, dimension: Optional[int] = None, dtype: str = STORAGE_DTYPE):
+        if dtype not in SUPPORTED_DTYPES:
+            raise ValueError(f"Unsupported storage dtype '{dtype}'. Choose one of: {', '.join(SUPPORTED_DTYPES)}")
+        self.dtype = dtype
+        self.dimension = dimension
+        self._size = 0
+        self._codes = None
+        self._scales = None
+        if dimension is not None:
+            self._allocate(dimension, 16)
+
+    def __len__(self):
+        return self._size
+
+    def _allocate(self, dimension: int, capacity: int):
+        """Create empty storage for the given dimension"""
+        self.dimension = dimension
+        self._codes = np.zeros((capacity, dimension), dtype=np.dtype(self.dtype))
+        self._scales = np.ones(capacity, dtype=np.float32)
+
+    def _quantize(self, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Normalize vectors and convert them to the storage dtype, returning (codes, scales)"""
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors = vectors / norms
+
+        if self.dtype == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+            return codes, scales.astype(np.float32)
+
+        return vectors.astype(np.dtype(self.dtype)), np.ones(len(vectors), dtype=np.float32)
+
+    def add(self, vectors: np.ndarray) -> range:
+        """Append vectors and return the row indices they were stored at"""
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        if self._codes is None:
+            self._allocate(vectors.shape[1], max(16, len(vectors)))
+        if vectors.shape[1] != self.dimension:
+            raise ValueError(f"Expected vectors of dimension {self.dimension}, got {vectors.shape[1]}")
+
+        needed = self._size + len(vectors)
+        if needed > len(self._codes):
+            # Grow geometrically so repeated single-row inserts stay amortized O(1)
+            capacity = max(needed, 2 * len(self._codes))
+            codes = np.zeros((capacity, self.dimension), dtype=self._codes.dtype)
+            scales = np.ones(capacity, dtype=np.float32)
+            codes[:self._size] = self._codes[:self._size]
+            scales[:self._size] = self._scales[:self._size]
+            self._codes, self._scales = codes, scales
+
+        codes, scales = self._quantize(vectors)
+        start = self._size
+        self._codes[start:needed] = codes
+        self._scales[start:needed] = scales
+        self._size = needed
+        return range(start, needed)
+
+    def remove(self, indices: Iterable[int]):
+        """Remove rows, compacting the remaining ones in order"""
+        # Nothing to remove before the first add allocates the matrix
+        if self._codes is None or self._size == 0:
+            return
+        keep = np.ones(self._size, dtype=bool)
+        keep[list(indices)] = False
+        remaining = int(keep.sum())
+        self._codes[:remaining] = self._codes[:self._size][keep]
+        self._scales[:remaining] = self._scales[:self._size][keep]
+        self._size = remaining
+
+    def clear(self):
+        """Drop every row but keep the dimension"""
+        self._size = 0
+
+    def scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Cosine similarity between the query and every stored row (or only the given rows)"""
+        count = self._size if rows is None else len(rows)
+        if count == 0:
+            return np.zeros(0, dtype=np.float32)
+
+        query_codes, query_scales = self._quantize(query)
+        query_codes = query_codes[0].astype(np.float32)
+        scores = np.empty(count, dtype=np.float32)
+        # One reused widening buffer instead of a fresh float32 copy of every block
+        widen = self._codes.dtype != np.float32
+        buffer = np.empty((min(SEARCH_BLOCK_ROWS, count), self.dimension), dtype=np.float32) if widen else None
+        for start in range(0, count, SEARCH_BLOCK_ROWS):
+            stop = min(start + SEARCH_BLOCK_ROWS, count)
+            block = self._codes[start:stop] if rows is None else self._codes[rows[start:stop]]
+            if widen:
+                # int8 codes are exact in float32, so this is an integer dot product run through BLAS
+                np.copyto(buffer[:stop - start], block)
+                block = buffer[:stop - start]
+            np.matmul(block, query_codes, out=scores[start:stop])
+
+        if self.dtype == "int8":
+            scores *= (self._scales[:self._size] if rows is None else self._scales[rows]) * query_scales[0]
+        return scores
+
+    def search(self, query: np.ndarray, k: int, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (row indices, scores) of the k most similar rows, best first.
+
+        With a mask covering under half the rows only those rows are read and scored,
+        so a search over a small subset costs in proportion to the subset.
+        """
+        rows = None if mask is None else np.flatnonzero(mask[:self._size])
+        if rows is not None and len(rows) > self._size // 2:
+            # Dense selections are cheaper to score in place and mask out than to gather into a copy
+            scores = self.scores(query)
+            scores[~mask[:self._size]] = -np.inf
+            k = min(k, len(rows))
+            rows = None
+        else:
+            scores = self.scores(query, rows)
+            k = min(k, len(scores))
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return (top if rows is None else rows[top]), scores[top]
+
+    def get(self, indices) -> np.ndarray:
+        """Dequantized float32 copies of the selected rows"""
+        indices = np.asarray(indices, dtype=np.int64)
+        vectors = self._codes[indices].astype(np.float32)
+        if self.dtype == "int8":
+            vectors *= self._scales[indices][:, None]
+        return vectors
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes used by the stored rows (excluding spare capacity)"""
+        if self._codes is None:
+            return 0
+        row_bytes = self._codes.dtype.itemsize * self.dimension
+        if self.dtype == "int8":
+            row_bytes += self._scales.dtype.itemsize
+        return row_bytes * self._size
+
+    @property
+    def codes(self) -> np.ndarray:
+        """Stored rows in their storage dtype (a view, not a copy)"""
+        return self._codes[:self._size]
+
+    @property
+    def scales(self) -> np.ndarray:
+        """Per-row int8 scales (all ones for float storage)"""
+        return self._scales[:self._size]
+
+    @classmethod
+    def from_codes(cls, codes: np.ndarray, scales: np.ndarray, dtype: str) -> "EmbeddingMatrix":
+        """Wrap already-quantized rows, e.g. memory-mapped arrays from a snapshot, without copying"""
+        matrix = cls.__new__(cls)
+        matrix.__setstate__({'dtype': dtype, 'dimension': codes.shape[1], 'codes': codes, 'scales': scales})
+        return matrix
+
+    def copy(self) -> "EmbeddingMatrix":
+        """Independent copy of the used rows"""
+        clone = EmbeddingMatrix.__new__(EmbeddingMatrix)
+        clone.__setstate__(self.__getstate__())
+        return clone
+
+    def __getstate__(self):
+        # Only persist the used rows, not the spare capacity
+        return {
+            'dtype': self.dtype,
+            'dimension': self.dimension,
+            'codes': None if self._codes is None else self._codes[:self._size].copy(),
+            'scales': None if self._scales is None else self._scales[:self._size].copy()
+        }
+
+    def __setstate__(self, state):
+        self.dtype = state['dtype']
+        self.dimension = state['dimension']
+        self._codes = state['codes']
+        self._scales = state['scales']
+        self._size = 0 if self._codes is None else len(self._codes)
+
+class MetadataIndex:
+    """Inverted index from metadata values to rows, turning Chroma-style filters into row masks.
+
+    Supports field equality and the $eq, $ne, $in and $nin operators, combined with
+    $and / $or. Postings for a field are built in one pass on first use and kept
+    until the rows change, so filtering costs no per-query scan of the metadata.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[Any, np.ndarray]] = {}
+        self._size = 0
+
+    def clear(self):
+        """Forget every posting list, e.g. after rows are added or removed"""
+        self._postings = {}
+
+    def _rows(self, metadatas: List[dict], field: str, value) -> np.ndarray:
+        if len(metadatas) != self._size:
+            self._postings, self._size = {}, len(metadatas)
+        if field not in self._postings:
+            postings = defaultdict(list)
+            for row, metadata in enumerate(metadatas):
+                if field in metadata:
+                    try:
+                        postings[metadata[field]].append(row)
+                    except TypeError:
+                        continue  # unhashable values cannot be matched by equality
+            self._postings[field] = {key: np.array(rows, dtype=np.int64) for key, rows in postings.items()}
+        return self._postings[field].get(value, np.zeros(0, dtype=np.int64))
+
+    def _any_of(self, metadatas: List[dict], field: str, values) -> np.ndarray:
+        mask = np.zeros(len(metadatas), dtype=bool)
+        for value in values:
+            mask[self._rows(metadatas, field, value)] = True
+        return mask
+
+    def _field_mask(self, metadatas: List[dict], field: str, condition) -> np.ndarray:
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        mask = np.ones(len(metadatas), dtype=bool)
+        for op, value in condition.items():
+            if op == "$eq":
+                mask &= self._any_of(metadatas, field, [value])
+            elif op == "$ne":
+                mask &= ~self._any_of(metadatas, field, [value])
+            elif op == "$in":
+                mask &= self._any_of(metadatas, field, value)
+            elif op == "$nin":
+                mask &= ~self._any_of(metadatas, field, value)
+            else:
+                raise ValueError(f"Unsupported filter operator '{op}'")
+        return mask
+
+    def mask(self, metadatas: List[dict], where: dict) -> np.ndarray:
+        """Boolean mask of the rows whose metadata matches the filter"""
+        mask = np.ones(len(metadatas), dtype=bool)
+        for key, condition in where.items():
+            if key == "$and":
+                for clause in condition:
+                    mask &= self.mask(metadatas, clause)
+            elif key == "$or":
+                either = np.zeros(len(metadatas), dtype=bool)
+                for clause in condition:
+                    either |= self.mask(metadatas, clause)
+                mask &= either
+            else:
+                mask &= self._field_mask(metadatas, key, condition)
+        return mask
+
+class CompactVectorStore(VectorStore):
+    """In-memory vector store holding chunk vectors in an EmbeddingMatrix.
+
+    One lock covers the matrix, the chunk lists and the metadata index, so a search
+    never sees an insert or delete half applied. Queries are embedded before it is taken.
+    """
+
+    def __init__(self, embedding: Embeddings, dtype: str = STORAGE_DTYPE):
+        self._embedding = embedding
+        self.matrix = EmbeddingMatrix(dtype=dtype)
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadatas: List[dict] = []
+        self.metadata_index = MetadataIndex()
+        self._lock = threading.RLock()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    @property
+    def dtype(self) -> str:
+        return self.matrix.dtype
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        """Embed and add texts, returning their ids"""
+        texts = list(texts)
+        if not texts:
+            return []
+        vectors = self._embedding.embed_documents(texts)
+        return self.add_embeddings(texts, vectors, metadatas=metadatas, ids=ids)
+
+    def add_embeddings(self, texts: List[str], embeddings, metadatas: Optional[List[dict]] = None,
+                       ids: Optional[List[str]] = None) -> List[str]:
+        """Add texts with precomputed embeddings, skipping model inference"""
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        metadatas = list(metadatas) if metadatas else [{} for _ in texts]
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            self.matrix.add(vectors)
+            self.ids.extend(ids)
+            self.texts.extend(texts)
+            self.metadatas.extend(dict(m) for m in metadatas)
+            self.metadata_index.clear()
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """Delete chunks by id"""
+        if not ids:
+            return False
+        targets = set(ids)
+        with self._lock:
+            rows = [i for i, chunk_id in enumerate(self.ids) if chunk_id in targets]
+            self.matrix.remove(rows)
+            for i in reversed(rows):
+                del self.ids[i], self.texts[i], self.metadatas[i]
+            self.metadata_index.clear()
+        return True
+
+    def _document(self, row: int) -> Document:
+        return Document(page_content=self.texts[row], metadata=dict(self.metadatas[row]))
+
+    def _mask(self, filter: Optional[dict]) -> Optional[np.ndarray]:
+        """Row mask for a metadata filter, applied before scoring"""
+        return None if not filter else self.metadata_index.mask(self.metadatas, filter)
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                               filter: Optional[dict] = None,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        with self._lock:
+            rows, scores = self.matrix.search(np.asarray(embedding, dtype=np.float32), k, self._mask(filter))
+            return [(self._document(row), float(score)) for row, score in zip(rows, scores)]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self._embedding.embed_query(query), k, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def _similarity_search_with_relevance_scores(self, query: str, k: int = 4,
+                                                 **kwargs: Any) -> List[Tuple[Document, float]]:
+        # Scores are already cosine similarities in [-1, 1]
+        return self.similarity_search_with_score(query, k, **kwargs)
+
+    def max_marginal_relevance_search_by_vector(self, embedding: List[float], k: int = 4, fetch_k: int = 20,
+                                                lambda_mult: float = 0.5, filter: Optional[dict] = None,
+                                                **kwargs: Any) -> List[Document]:
+        query = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            rows, _ = self.matrix.search(query, fetch_k, self._mask(filter))
+            if len(rows) == 0:
+                return []
+            candidates = self.matrix.get(rows)
+            documents = [self._document(row) for row in rows]
+        # Only the fetch_k candidates are dequantized for the diversity step, which runs unlocked on copies
+        selected = maximal_marginal_relevance(query, candidates, k=k, lambda_mult=lambda_mult)
+        return [documents[i] for i in selected]
+
+    def max_marginal_relevance_search(self, query: str, k: int = 4, fetch_k: int = 20,
+                                      lambda_mult: float = 0.5, **kwargs: Any) -> List[Document]:
+        return self.max_marginal_relevance_search_by_vector(
+            self._embedding.embed_query(query), k, fetch_k, lambda_mult, **kwargs
+        )
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   ids: Optional[List[str]] = None, dtype: str = STORAGE_DTYPE, **kwargs: Any) -> "CompactVectorStore":
+        store = cls(embedding, dtype=dtype)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+    def export_chunks(self):
+        """All chunks as (ids, texts, metadatas, matrix), copied so later writes do not change them"""
+        with self._lock:
+            return list(self.ids), list(self.texts), list(self.metadatas), self.matrix.copy()
+
+    def save(self, path: str):
+        """Persist chunks and their stored vectors to a single file"""
+        with self._lock, open(path, 'wb') as f:
+            pickle.dump({'matrix': self.matrix, 'ids': self.ids, 'texts': self.texts,
+                         'metadatas': self.metadatas}, f)
+
+    @classmethod
+    def load(cls, path: str, embedding: Embeddings) -> "CompactVectorStore":
+        """Load a store written by save() without re-embedding anything"""
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+        store = cls(embedding, dtype=state['matrix'].dtype)
+        store.matrix = state['matrix']
+        store.ids, store.texts, store.metadatas = state['ids'], state['texts'], state['metadatas']
+        return store
+
+    def get_stats(self):
+        """Chunk count and vector memory footprint"""
+        return {
+            'chunks': len(self.ids),
+            'dtype': self.matrix.dtype,
+            'vector_bytes': self.matrix.nbytes
+        }
+
+def add_precomputed_embeddings(vectordb, texts: List[str], embeddings, metadatas: List[dict],
+                               ids: List[str], batch_size: int = 5000):
+    """Insert chunks with precomputed embeddings into an in-memory or Chroma store"""
+    if hasattr(vectordb, 'add_embeddings'):
+        return vectordb.add_embeddings(texts, embeddings, metadatas=metadatas, ids=ids)
+
+    # Chroma: write straight to the underlying collection so the model is not invoked again
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    for start in range(0, len(texts), batch_size):
+        stop = start + batch_size
+        vectordb._collection.upsert(
+            ids=list(ids[start:stop]),
+            embeddings=embeddings[start:stop].tolist(),
+            metadatas=list(metadatas[start:stop]),
+            documents=list(texts[start:stop])
+        )
+    return list(ids)
@@ -0,0 +1,189 @@
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+from main import extract_sources
+
+# Warm the semantic cache from the query log at startup (when an index is loaded) and after /clear-cache
+WARMUP_ON_START = os.environ.get("RAG_WARMUP_ON_START", "1") == "1"
+
+# Limits for one warm-up run: distinct queries answered, wall-clock seconds, and share of one CPU used
+WARMUP_MAX_QUERIES = int(os.environ.get("RAG_WARMUP_MAX_QUERIES", 200))
+WARMUP_TIME_BUDGET = float(os.environ.get("RAG_WARMUP_TIME_BUDGET", 120))
+WARMUP_CPU_FRACTION = float(os.environ.get("RAG_WARMUP_CPU_FRACTION", 0.5))
+WARMUP_BATCH_SIZE = 16
+
+# A past occurrence of a query counts half as much every this many hours
+WARMUP_HALF_LIFE_HOURS = 24.0
+
+def rank_queries(history: List[Tuple[str, float]], half_life_hours: float = WARMUP_HALF_LIFE_HOURS,
+                 now: Optional[float] = None) -> List[str]:
+    """Distinct queries ordered by recency-weighted frequency, most valuable first"""
+    now = now or time.time()
+    scores = defaultdict(float)
+    latest = {}
+    for query, timestamp in history:
+        query = query.strip()
+        if not query:
+            continue
+        age_hours = max(now - timestamp, 0.0) / 3600
+        scores[query] += 0.5 ** (age_hours / half_life_hours)
+        latest[query] = max(latest.get(query, 0.0), timestamp)
+    return sorted(scores, key=lambda query: (scores[query], latest[query]), reverse=True)
+
+class CacheWarmer:
+    """Background job that answers popular historical queries so they are cached before users ask.
+
+    Queries are mined from the evaluator's log, ranked by recency-weighted frequency,
+    then checked against the cache and answered batch by batch, most valuable first.
+    Each batch takes a query admission slot only when no user request is waiting for
+    one, and the job sleeps between batches to stay under its CPU share.
+    """
+
+    def __init__(self, semantic_cache, evaluator, answer_batch: Callable[[List[str]], List[str]],
+                 admission=None, max_queries: int = WARMUP_MAX_QUERIES, time_budget: float = WARMUP_TIME_BUDGET,
+                 cpu_fraction: float = WARMUP_CPU_FRACTION, batch_size: int = WARMUP_BATCH_SIZE):
+        self.semantic_cache = semantic_cache
+        self.evaluator = evaluator
+        self.answer_batch = answer_batch
+        self.admission = admission
+        self.max_queries = max_queries
+        self.time_budget = time_budget
+        self.cpu_fraction = min(max(cpu_fraction, 0.05), 1.0)
+        self.batch_size = batch_size
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._status = {'state': 'idle'}
+
+    def start(self, max_queries: Optional[int] = None, time_budget: Optional[float] = None) -> bool:
+        """Start a warm-up run in the background; returns False if one is already running"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._stop.clear()
+            self._status = {
+                'state': 'starting',
+                'candidates': 0,
+                'scanned': 0,
+                'already_cached': 0,
+                'total': 0,
+                'warmed': 0,
+                'batches': 0,
+                'started_at': time.time(),
+                'elapsed_s': 0.0
+            }
+            self._thread = threading.Thread(
+                target=self._run,
+                args=(max_queries or self.max_queries, time_budget or self.time_budget),
+                name="cache-warmup",
+                daemon=True
+            )
+            self._thread.start()
+        return True
+
+    def stop(self, timeout: Optional[float] = None):
+        """Ask a running warm-up to finish after its current batch"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _update(self, **fields):
+        with self._lock:
+            self._status.update(fields)
+            self._status['elapsed_s'] = time.time() - self._status['started_at']
+
+    def _user_traffic_waiting(self) -> bool:
+        if self.admission is None:
+            return False
+        stats = self.admission.get_stats()
+        return stats['queue_depth'] > 0 or stats['in_flight'] >= stats['max_in_flight']
+
+    def _run(self, max_queries: int, time_budget: float):
+        start = time.monotonic()
+        try:
+            ranked = rank_queries(self.evaluator.get_query_history())
+            self._update(state='running', candidates=len(ranked), total=min(max_queries, len(ranked)))
+            print(f"🔥 Cache warm-up: answering up to {max_queries} uncached of {len(ranked)} historical queries")
+
+            done, scanned, queries = 0, 0, []
+            while done < max_queries and (queries or scanned < len(ranked)):
+                if self._stop.is_set():
+                    self._update(state='stopped')
+                    return
+                if time.monotonic() - start > time_budget:
+                    self._update(state='time_budget_exhausted')
+                    print(f"⏱️ Cache warm-up stopped at its {time_budget:.0f}s budget after {done} queries")
+                    return
+
+                # User misses always go first; back off while any are waiting for a slot
+                if self._user_traffic_waiting():
+                    self._stop.wait(0.5)
+                    continue
+
+                if not queries:
+                    # Misses are found one batch at a time, so the query and time limits also bound
+                    # the embedding work of the cache check, and the scan stops once enough are found
+                    started = time.perf_counter()
+                    batch = ranked[scanned:scanned + self.batch_size]
+                    scanned += len(batch)
+                    queries = self.semantic_cache.missing(batch)
+                    with self._lock:
+                        self._status['scanned'] = scanned
+                        self._status['already_cached'] += len(batch) - len(queries)
+                    queries = queries[:max_queries - done]
+                    busy = time.perf_counter() - started
+                else:
+                    busy = self._answer(queries)
+                    if busy is None:
+                        self._stop.wait(0.5)
+                        continue
+                    done += len(queries)
+                    with self._lock:
+                        self._status['warmed'] += len(queries)
+                        self._status['batches'] += 1
+                    queries = []
+                self._update()
+
+                # Duty cycle: idle long enough that this job averages cpu_fraction of a core
+                self._stop.wait(busy * (1 - self.cpu_fraction) / self.cpu_fraction)
+
+            self._update(state='completed', total=done)
+            print(f"✅ Cache warm-up finished: {done} queries cached in {time.monotonic() - start:.1f}s")
+        except Exception as e:
+            self._update(state='failed', error=str(e))
+            print(f"❌ Cache warm-up failed: {e}")
+
+    def _answer(self, batch: List[str]) -> Optional[float]:
+        """Answer and cache one batch; returns the time spent, or None if no slot was free"""
+        if self.admission is not None:
+            # Background slot: a busy server is not a shed request, so /metrics is not inflated
+            with self.admission.slot(background=True) as admitted:
+                if not admitted:
+                    return None
+                started = time.perf_counter()
+                answers = self.answer_batch(batch)
+        else:
+            started = time.perf_counter()
+            answers = self.answer_batch(batch)
+        busy = time.perf_counter() - started
+
+        per_query = busy / len(batch)
+        self.semantic_cache.set_many([
+            (question, {'response': answer, 'sources': extract_sources(answer),
+                        'response_time': per_query, 'warmed': True})
+            for question, answer in zip(batch, answers)
+        ])
+        return time.perf_counter() - started
+
+    def get_status(self) -> Dict:
+        """Progress of the current or last warm-up run"""
+        with self._lock:
+            status = dict(self._status)
+        if status.get('state') in ('starting', 'running'):
+            status['elapsed_s'] = time.time() - status['started_at']
+        if status.get('total'):
+            status['progress'] = status['warmed'] / status['total']
+        return status